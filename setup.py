@@ -10,7 +10,7 @@ setuptools.setup(
     long_description                    = open('README.md').read(),
     url                                 = "https://github.com/devsosin/sosin",
     install_requires                    = ['requests', 'requests-toolbelt', 'httpx'],
-    packages                            = setuptools.find_namespace_packages(include=['*']),
+    packages                            = setuptools.find_namespace_packages(include=['*'], exclude=['tests', 'tests.*']),
     python_requires                     = '>=3.9',
     classifiers                         = [
         "Programming Language :: Python :: 3",
@@ -1,15 +1,51 @@
 __version__ = '1.5.3'
 
-from .databases.rdb.maria import MariaDB
-from .databases.rdb.postgre import PostgreSQL
+# top-level names are imported on first access (PEP 562), so `import sosin`
+# does not load DB drivers, selenium or the http clients until they are used
+import importlib
+from typing import TYPE_CHECKING
 
-from .rpa.email_mgr import EmailManager
-from .rpa.sms_mgr import AligoManager
+_lazy_imports = {
+    'MariaDB': '.databases.rdb.maria',
+    'PostgreSQL': '.databases.rdb.postgre',
 
-from .web.session import SessionManager
-from .web.session_async import AsyncSessionManager
-from .web.virtual import VirtualDriver
+    'EmailManager': '.rpa.email_mgr',
+    'AligoManager': '.rpa.sms_mgr',
 
-from .utils.secret import read_config
-from .utils.log import logging
-from .utils.progress import progressBar
+    'SessionManager': '.web.session',
+    'AsyncSessionManager': '.web.session_async',
+    'BackgroundSessionManager': '.web.session_bridge',
+    'VirtualDriver': '.web.virtual',
+
+    'read_config': '.utils.secret',
+    'logging': '.utils.log',
+    'progressBar': '.utils.progress',
+}
+
+__all__ = list(_lazy_imports)
+
+def __getattr__(name):
+    if name in _lazy_imports:
+        value = getattr(importlib.import_module(_lazy_imports[name], __name__), name)
+        globals()[name] = value
+        return value
+    raise AttributeError(f'module {__name__!r} has no attribute {name!r}')
+
+def __dir__():
+    return sorted(set(globals()) | set(_lazy_imports))
+
+if TYPE_CHECKING:
+    from .databases.rdb.maria import MariaDB
+    from .databases.rdb.postgre import PostgreSQL
+
+    from .rpa.email_mgr import EmailManager
+    from .rpa.sms_mgr import AligoManager
+
+    from .web.session import SessionManager
+    from .web.session_async import AsyncSessionManager
+    from .web.session_bridge import BackgroundSessionManager
+    from .web.virtual import VirtualDriver
+
+    from .utils.secret import read_config
+    from .utils.log import logging
+    from .utils.progress import progressBar
@@ -1,7 +1,15 @@
 # interface
 
+import threading
+import weakref
+
 from abc import ABC, abstractmethod
-from typing import Any, Dict, Iterable, List, Optional, Tuple, Union, overload
+from contextlib import contextmanager
+from functools import wraps
+from itertools import islice
+from typing import Any, Dict, Iterable, Iterator, List, Optional, Tuple, Union, overload
+
+from sosin.databases.pool import ConnectionPool
 try:
     from pymysql.connections import Connection
     from pymysql.cursors import Cursor, DictCursor
@@ -23,17 +31,58 @@ except:
     class CursorType(): ...
     class CursorKindType(): ...
 
+def iter_chunks(rows:Iterable, size:int) -> Iterator[list]:
+    """
+    lists of up to size rows, only one chunk is held at a time
+    """
+    rows = iter(rows)
+    while True:
+        chunk = list(islice(rows, size))
+        if not chunk:
+            return
+        yield chunk
+
+NOT_CHECKED_OUT = 'no connection checked out in this thread, use `with db.connection():`'
+
+def pooled(method):
+    """
+    run a Database method on a pooled connection
+    checked out for the call unless the thread already holds one (nested calls share it)
+    """
+    @wraps(method)
+    def wrapper(self, *args, **kwargs):
+        if self.pool_options is None or self._bound():
+            return method(self, *args, **kwargs)
+        with self.connection():
+            return method(self, *args, **kwargs)
+    return wrapper
+
+def _weak_method(method):
+    """
+    call a bound method without keeping its object alive
+    the pool holds its factory, a bound method would keep the Database (and __del__) from going away
+    """
+    ref = weakref.WeakMethod(method)
+    def call(*args):
+        method = ref()
+        if method is None:
+            raise ReferenceError('the Database of this pool was garbage collected')
+        return method(*args)
+    return call
+
 class Database(ABC):
     """
     데이터베이스 추상클래스
     """
 
-    DB: ConnectionType
     db_config: Dict[str, str]
-    cursor: Optional[CursorType] = None
     cursor_type: Optional[CursorKindType]
+    pool: Optional[ConnectionPool] = None
     
-    def __init__(self, db_config: Dict[str, str], cursor_type:Optional[CursorKindType]=None) -> None:
+    def __init__(self, 
+                 db_config: Dict[str, str], 
+                 cursor_type:Optional[CursorKindType]=None, 
+                 pool:Union[bool, Dict[str, Any]]=None) -> None:
         """
         **db_config**
             host=database host (localhost)
@@ -42,9 +91,19 @@ class Database(ABC):
             password=password (1q2w3e)
             database=database name (testdb)
             charset=charcter encoding (utf8mb4)
+        **pool** True or ConnectionPool options
+            min_size=connections kept open (1)
+            max_size=connections open at most (10)
+            timeout=checkout wait in seconds (30)
+            max_lifetime=seconds before a connection is replaced (3600)
+            max_idle=seconds before an idle connection is closed (600)
+            every thread works on its own checked out connection and cursor
         """
         self.db_config = db_config
         self.cursor_type = cursor_type
+        self.pool_options = ({} if pool is True else dict(pool)) if pool else None
+        self._local = threading.local()
+        self._pool_lock = threading.Lock()
 
     def __enter__(self):
         """
@@ -66,14 +125,142 @@ class Database(ABC):
     def __exit__(self, exc_type, exc_val, exc_tb) -> None:
         self.disconnect()
 
+    # ------------------------------------------------------------------------
+    # Connection Management
     @abstractmethod
-    def connect(self): ...
+    def _new_connection(self) -> ConnectionType: ...
+
+    def _new_cursor(self, conn:ConnectionType) -> CursorType:
+        return conn.cursor(self.cursor_type)
+
+    def _server_cursor(self, conn:ConnectionType, batch_size:int) -> CursorType:
+        """
+        unbuffered cursor streaming rows from the server
+        """
+        raise NotImplementedError(f'{type(self).__name__} has no server-side cursor')
+
+    def _ping(self, conn:ConnectionType) -> bool:
+        """
+        liveness check on pool checkout
+        """
+        return True
+
+    def connect(self):
+        if self.pool_options is not None:
+            with self._pool_lock:
+                if self.pool is None:
+                    self.pool = ConnectionPool(_weak_method(self._new_connection), 
+                                               ping=_weak_method(self._ping), **self.pool_options)
+            return self
+        self.DB = self._new_connection()
+        self.cursor = self._new_cursor(self.DB)
+        return self
 
     def disconnect(self):
+        if self.pool_options is not None:
+            if self.pool is not None:
+                self.pool.close()
+                self.pool = None
+            return
         if self.cursor:
             self.cursor.close()
         self.DB.close()
 
+    @property
+    def DB(self) -> ConnectionType:
+        if self.pool_options is None:
+            return self._DB
+        conn = getattr(self._local, 'DB', None)
+        if conn is None:
+            raise RuntimeError(NOT_CHECKED_OUT)
+        return conn
+
+    @DB.setter
+    def DB(self, conn:ConnectionType) -> None:
+        if self.pool_options is None:
+            self._DB = conn
+        else:
+            self._local.DB = conn
+
+    @property
+    def cursor(self) -> Optional[CursorType]:
+        if self.pool_options is None:
+            return self.__dict__.get('_cursor')
+        cursor = getattr(self._local, 'cursor', None)
+        if cursor is None:
+            raise RuntimeError(NOT_CHECKED_OUT)
+        return cursor
+
+    @cursor.setter
+    def cursor(self, cursor:Optional[CursorType]) -> None:
+        if self.pool_options is None:
+            self._cursor = cursor
+        else:
+            self._local.cursor = cursor
+
+    def _bound(self) -> bool:
+        return getattr(self._local, 'DB', None) is not None
+
+    @contextmanager
+    def connection(self, timeout:float=None):
+        """
+        check out a pooled connection and its own cursor for this thread
+        ```py
+        with db.connection():
+            db.execute(...)
+            db.commit()
+        ```
+        not pooled -> the shared connection
+        """
+        if self.pool_options is None or self._bound():
+            yield self
+            return
+        with self._checkout(timeout) as conn:
+            cursor = self._new_cursor(conn)
+            self._local.DB, self._local.cursor = conn, cursor
+            try:
+                yield self
+            finally:
+                self._local.DB = self._local.cursor = None
+                try:
+                    cursor.close()
+                except Exception:
+                    # a dead connection fails the rollback as well
+                    ...
+
+    @contextmanager
+    def _checkout(self, timeout:float=None):
+        """
+        pooled connection, rolled back and released afterwards (discarded when broken)
+        """
+        if self.pool is None:
+            self.connect()
+
+        conn = self.pool.acquire(timeout)
+        broken = failed = False
+        try:
+            yield conn
+        except Exception:
+            failed = True
+            raise
+        finally:
+            try:
+                # nothing uncommitted leaks into the next checkout
+                conn.rollback()
+            except Exception:
+                broken = True
+            if failed and not broken:
+                # ping after the rollback, a failed transaction rejects every statement
+                # and a failing ping must not replace the caller's error
+                broken = not self.pool._alive(conn)
+            self.pool.release(conn, discard=broken)
+
+    def pool_stats(self) -> dict:
+        """
+        pool wait times and utilization, empty when not pooled
+        """
+        return self.pool.stats() if self.pool is not None else {}
+
     def execute(self, query, args=None):
         self.cursor.execute(query, args)
 
@@ -91,6 +278,7 @@ class Database(ABC):
                value: Tuple
                ) -> bool: ...
     
+    @pooled
     def insert(self, query, args=None) -> bool:
         try:
             self.execute(query, args)
@@ -108,6 +296,7 @@ class Database(ABC):
                     values:List[Tuple]
                     ) -> bool: ...
 
+    @pooled
     def insert_many(self, query, values) -> bool:
         try:
             self.executemany(query, values)
@@ -128,6 +317,7 @@ class Database(ABC):
         page_info: Optional[Tuple[int, int]]=None): ...
 
     # not overloaded use just last function
+    @pooled
     def select(self, query: str):
         try:
             self.cursor.execute(query)
@@ -135,6 +325,36 @@ class Database(ABC):
         except Exception as e:
             return ("SELECT ERR", e)
     
+    def stream(self, query: str, args=None, batch_size: int=1000, chunked: bool=False) -> Iterator:
+        """
+        rows of query from a server-side cursor, at most batch_size rows held at a time
+        chunked: yield lists of up to batch_size rows instead of single rows
+        the cursor is closed when the consumer stops early or fails
+        pooled: the stream checks out a connection of its own without binding it to the thread,
+                so queries inside the loop (db.insert, ...) run on another one
+        not pooled: keep other queries off the connection until the stream is done
+        """
+        if self.pool_options is None:
+            yield from self._stream(self.DB, query, args, batch_size, chunked)
+            return
+        with self._checkout() as conn:
+            yield from self._stream(conn, query, args, batch_size, chunked)
+
+    def _stream(self, conn:ConnectionType, query: str, args, batch_size: int, chunked: bool) -> Iterator:
+        cursor = self._server_cursor(conn, batch_size)
+        try:
+            cursor.execute(query, args)
+            while True:
+                rows = cursor.fetchmany(batch_size)
+                if not rows:
+                    break
+                if chunked:
+                    yield list(rows)
+                else:
+                    yield from rows
+        finally:
+            cursor.close()
+
     @abstractmethod
     def where(self, column: str, value: str, option: str=None): ...
     @abstractmethod
@@ -151,6 +371,7 @@ class Database(ABC):
                where_info: Tuple[str, Any]
                ) -> bool: ...
 
+    @pooled
     def update(self, query, args=None) -> bool:
         try:
             self.execute(query, args)
@@ -168,6 +389,7 @@ class Database(ABC):
                where_info: Tuple[str, Any]
                ) -> bool: ...
 
+    @pooled
     def delete(self, query, args=None) -> bool:
         try:
             self.execute(query, args)
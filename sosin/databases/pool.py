@@ -0,0 +1,295 @@
+import threading
+import time
+import weakref
+
+from collections import deque
+from contextlib import contextmanager
+from typing import Any, Callable, Optional
+
+class PoolTimeout(Exception):
+    """
+    no connection could be checked out in time
+    """
+
+class _Slot:
+
+    __slots__ = ('conn', 'created_at', 'last_used')
+
+    def __init__(self, conn:Any) -> None:
+        self.conn = conn
+        self.created_at = time.monotonic()
+        self.last_used = self.created_at
+
+class ConnectionPool:
+    """
+    thread-safe DB-API connection pool
+
+    factory: () -> new connection
+    min_size: connections kept open, even when idle
+    max_size: connections open at most, checkouts wait beyond that
+    timeout: seconds a checkout waits before PoolTimeout
+    max_lifetime: connections older than this are closed instead of reused
+    max_idle: idle connections above min_size are closed after this many seconds
+    ping: (conn) -> bool liveness check on checkout, dead connections are replaced
+    """
+
+    def __init__(self,
+                 factory:Callable[[], Any],
+                 min_size:int=1,
+                 max_size:int=10,
+                 timeout:float=30.0,
+                 max_lifetime:Optional[float]=3600.0,
+                 max_idle:Optional[float]=600.0,
+                 ping:Callable[[Any], bool]=None
+                 ) -> None:
+        assert 0 <= min_size <= max_size and max_size > 0, 'min_size <= max_size'
+        self.factory = factory
+        self.min_size = min_size
+        self.max_size = max_size
+        self.timeout = timeout
+        self.max_lifetime = max_lifetime
+        self.max_idle = max_idle
+        self.ping = ping
+
+        self._idle = deque()
+        self._in_use = {}
+        self._pending = 0
+        self._waiting = 0
+        self._closed = False
+        self._cond = threading.Condition()
+
+        # stats
+        self.checkouts = 0
+        self.timeouts = 0
+        self.created = 0
+        self.discarded = 0
+        self.wait_total = 0.0
+        self.wait_max = 0.0
+        self.peak_in_use = 0
+        self._started = time.monotonic()
+        self._busy_time = 0.0
+        self._busy_mark = self._started
+
+        for _ in range(min_size):
+            self._idle.append(self._open())
+
+        self._reaper = None
+        if max_idle or max_lifetime:
+            interval = min(t for t in (max_idle, max_lifetime) if t) / 2
+            # the thread only holds a weak reference, an unused pool can still be collected
+            self._reaper = threading.Thread(target=self._reap_loop, args=(weakref.ref(self), interval),
+                                            name='sosin-db-pool-reaper', daemon=True)
+            self._reaper.start()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb) -> None:
+        self.close()
+
+    @property
+    def size(self) -> int:
+        return len(self._idle) + len(self._in_use) + self._pending
+
+    # ------------------------------------------------------------------------
+    # Checkout
+    def acquire(self, timeout:float=None) -> Any:
+        """
+        check a connection out, wait up to timeout for one to be released
+        """
+        timeout = self.timeout if timeout is None else timeout
+        start = time.monotonic()
+        deadline = start + timeout
+        while True:
+            slot = None
+            with self._cond:
+                while True:
+                    if self._closed:
+                        raise PoolTimeout('pool is closed')
+                    if self._idle:
+                        # LIFO keeps the warmest connections busy and lets the rest idle out
+                        slot = self._idle.pop()
+                        self._pending += 1
+                        break
+                    if self.size < self.max_size:
+                        self._pending += 1
+                        break
+                    remaining = deadline - time.monotonic()
+                    if remaining <= 0:
+                        self.timeouts += 1
+                        raise PoolTimeout(f'no connection available in {timeout}s (max_size={self.max_size})')
+                    self._waiting += 1
+                    try:
+                        self._cond.wait(remaining)
+                    finally:
+                        self._waiting -= 1
+
+            # opened or checked outside the lock, still counted in size meanwhile
+            try:
+                if slot is None:
+                    slot = self._open()
+                elif self._expired(slot) or not self._alive(slot.conn):
+                    self._discard(slot)
+                    slot = None
+            except Exception:
+                with self._cond:
+                    self._pending -= 1
+                    self._cond.notify()
+                raise
+
+            with self._cond:
+                self._pending -= 1
+                if slot is None:
+                    self._cond.notify()
+                    continue
+                self._mark_busy()
+                self._in_use[id(slot.conn)] = slot
+                waited = time.monotonic() - start
+                self.checkouts += 1
+                self.wait_total += waited
+                self.wait_max = max(self.wait_max, waited)
+                self.peak_in_use = max(self.peak_in_use, len(self._in_use))
+            return slot.conn
+
+    def release(self, conn:Any, discard:bool=False) -> None:
+        """
+        return a checked out connection, discard it when it is broken
+        """
+        with self._cond:
+            self._mark_busy()
+            slot = self._in_use.pop(id(conn), None)
+            if slot is None:
+                return
+            keep = not (discard or self._closed or self._expired(slot))
+            if keep:
+                slot.last_used = time.monotonic()
+                self._idle.append(slot)
+            self._cond.notify()
+        if not keep:
+            self._discard(slot)
+
+    @contextmanager
+    def connection(self, timeout:float=None):
+        conn = self.acquire(timeout)
+        try:
+            yield conn
+        except Exception:
+            self.release(conn, discard=not self._alive(conn))
+            raise
+        else:
+            self.release(conn)
+
+    def close(self) -> None:
+        """
+        close idle connections, checked out ones are closed when released
+        """
+        with self._cond:
+            self._closed = True
+            idle, self._idle = list(self._idle), deque()
+            self._cond.notify_all()
+        for slot in idle:
+            self._discard(slot)
+
+    # ------------------------------------------------------------------------
+    # Stats
+    def stats(self) -> dict:
+        """
+        wait times and utilization for sizing the pool
+        utilization: average share of max_size checked out since the pool was created
+        """
+        with self._cond:
+            self._mark_busy()
+            elapsed = max(time.monotonic() - self._started, 1e-9)
+            return {'size': self.size,
+                    'idle': len(self._idle),
+                    'in_use': len(self._in_use),
+                    'waiting': self._waiting,
+                    'max_size': self.max_size,
+                    'peak_in_use': self.peak_in_use,
+                    'checkouts': self.checkouts,
+                    'timeouts': self.timeouts,
+                    'created': self.created,
+                    'discarded': self.discarded,
+                    'wait_avg': self.wait_total / self.checkouts if self.checkouts else 0.0,
+                    'wait_max': self.wait_max,
+                    'utilization': self._busy_time / elapsed / self.max_size}
+
+    def _mark_busy(self) -> None:
+        # integrate in_use over time, called with the lock held before in_use changes
+        now = time.monotonic()
+        self._busy_time += len(self._in_use) * (now - self._busy_mark)
+        self._busy_mark = now
+
+    # ------------------------------------------------------------------------
+    # Connections
+    def _open(self) -> _Slot:
+        slot = _Slot(self.factory())
+        with self._cond:
+            self.created += 1
+        return slot
+
+    def _discard(self, slot:_Slot) -> None:
+        with self._cond:
+            self.discarded += 1
+        try:
+            slot.conn.close()
+        except Exception:
+            ...
+
+    def _expired(self, slot:_Slot) -> bool:
+        return bool(self.max_lifetime) and time.monotonic() - slot.created_at > self.max_lifetime
+
+    def _alive(self, conn:Any) -> bool:
+        if self.ping is None:
+            return True
+        try:
+            return bool(self.ping(conn))
+        except Exception:
+            return False
+
+    @staticmethod
+    def _reap_loop(ref:'weakref.ref[ConnectionPool]', interval:float) -> None:
+        while True:
+            time.sleep(interval)
+            pool = ref()
+            if pool is None or pool._closed:
+                return
+            pool.reap()
+            del pool
+
+    def reap(self) -> None:
+        """
+        close expired and long idle connections, keep min_size open
+        """
+        now = time.monotonic()
+        with self._cond:
+            keep, drop = deque(), []
+            # LIFO checkout leaves the longest idle at the left
+            for slot in self._idle:
+                if self._expired(slot):
+                    drop.append(slot)
+                elif self.max_idle and now - slot.last_used > self.max_idle \
+                        and self.size - len(drop) > self.min_size:
+                    drop.append(slot)
+                else:
+                    keep.append(slot)
+            self._idle = keep
+        for slot in drop:
+            self._discard(slot)
+
+        # refill up to min_size
+        while not self._closed:
+            with self._cond:
+                if self.size >= self.min_size:
+                    break
+                self._pending += 1
+            try:
+                slot = self._open()
+            except Exception:
+                with self._cond:
+                    self._pending -= 1
+                break
+            with self._cond:
+                self._pending -= 1
+                self._idle.appendleft(slot)
+                self._cond.notify()
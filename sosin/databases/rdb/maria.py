@@ -1,33 +1,48 @@
 try:
     import pymysql
-    from pymysql.cursors import DictCursor
+    from pymysql.constants import CLIENT
+    from pymysql.cursors import DictCursor, SSCursor, SSDictCursor
 except:
     print('you need to install pymysql\n$ : python -m pip install pymysql')
+import os
+import re
+import tempfile
 import traceback
 
-from typing import Iterable, Union
+from typing import Callable, Iterable, Iterator, Union
 
-from sosin.databases.db import Database
+from sosin.databases.db import Database, iter_chunks, pooled
 
 class MariaDB(Database):
     """
     MariaDB
     """
     
-    def __init__(self, db_config:dict, cursor_type:str = None) -> None:
+    def __init__(self, db_config:dict, cursor_type:str = None, pool:Union[bool, dict] = None) -> None:
+        """
+        cursor_type = 'dict' or None
+        pool = True or ConnectionPool options (min_size, max_size, timeout, ...)
+        """
         db_config['port'] = int(db_config.get('port', '3306'))
         if cursor_type == 'dict':
-            self.cursor_type = DictCursor
+            cursor_type = DictCursor
         else:
-            self.cursor_type = None
+            cursor_type = None
+
+        super().__init__(db_config, cursor_type, pool)
+
+    def _new_connection(self):
+        return pymysql.connect(**self.db_config)
 
-        super().__init__(db_config, cursor_type)
+    def _ping(self, conn) -> bool:
+        conn.ping(reconnect=False)
+        return True
 
-    def connect(self):
-        self.DB = pymysql.connect(**self.db_config)
-        self.cursor = self.DB.cursor(cursor=self.cursor_type)
-        return self
+    def _server_cursor(self, conn, batch_size:int):
+        # closing early drains the rest of the result, the protocol has no way to skip it
+        return conn.cursor(SSDictCursor if self.cursor_type is DictCursor else SSCursor)
     
+    @pooled
     def create_table(self, tb_name:str, fields:list, foreign_keys:list=[], auto_pk=True):
         """
         create table
@@ -78,6 +93,7 @@ class MariaDB(Database):
             self.DB.rollback()
             return False
     
+    @pooled
     def drop_table(self, tables:Iterable[str], forcing=True) -> bool:
         """
         drop table
@@ -97,6 +113,7 @@ class MariaDB(Database):
             self.DB.rollback()
             return False
     
+    @pooled
     def get_tables(self) -> list:
         """
         get table names
@@ -106,6 +123,7 @@ class MariaDB(Database):
         result = self.cursor.fetchall()
         return [t[0] for t in result]
     
+    @pooled
     def get_table_columns(self, table:str) -> list[dict]:
         """
         get table column infos
@@ -130,6 +148,21 @@ class MariaDB(Database):
         column_qry = "id, name, email"
         table = "Students"
         """
+        sql_qr = self.select_query(column_qry, table, limit, offset, order_by, where_condition)
+        return super().select(sql_qr)
+
+    def iter_select(self, column_qry:str, table:str, limit=None, offset=None, order_by=None, where_condition=[], 
+                    batch_size:int=1000, chunked:bool=False) -> Iterator:
+        """
+        same as select, but rows are streamed from a server-side cursor (SSCursor / SSDictCursor)
+        batch_size: rows fetched per round trip
+        chunked: yield lists of rows
+        """
+        sql_qr = self.select_query(column_qry, table, limit, offset, order_by, where_condition)
+        return self.stream(sql_qr, batch_size=batch_size, chunked=chunked)
+
+    @staticmethod
+    def select_query(column_qry:str, table:str, limit=None, offset=None, order_by=None, where_condition=[]) -> str:
         sql_qr = "SELECT {0} FROM {1}".format(column_qry, table)
         if where_condition:
             for i, (col, eq, val) in enumerate(where_condition):
@@ -142,9 +175,9 @@ class MariaDB(Database):
             sql_qr += ' LIMIT {}'.format(limit)
         if offset:
             sql_qr += ' OFFSET {}'.format(offset)
-
-        return super().select(sql_qr)
+        return sql_qr
     
+    @pooled
     def insert(self, table:str, columns: str, value: tuple) -> Union[int, bool]:
         """
         Insert Data
@@ -177,11 +210,200 @@ class MariaDB(Database):
         ]
         """
         ignore_sql = 'IGNORE ' if ignore else ''
-        sql = f"INSERT {ignore_sql} INTO {table}({columns}) " \
-                  "VALUES ("  + ','.join(["%s"]*len(values[0])) + ");"
+        # no trailing `;`, pymysql only rewrites executemany into multi-row INSERTs without it
+        sql = f"INSERT {ignore_sql}INTO {table}({columns}) " \
+                  "VALUES ("  + ','.join(["%s"]*len(values[0])) + ")"
         
         return super().insert_many(sql, values)
 
+    @pooled
+    def bulk_insert(self, table:str, columns:Union[str, list], rows:Iterable, ignore:bool=False, 
+                    commit_every:int=None, max_packet:int=None, local_infile:bool=False, 
+                    chunk_size:int=100000, progress:Callable[[int], None]=None) -> Union[int, bool]:
+        """
+        load many rows, returns the number of rows sent or False (rolled back)
+
+        rows -> any iterable of tuples (generators are fine)
+        default: rows escaped and packed into multi-row INSERTs as large as
+                 max_packet (server @@max_allowed_packet when None)
+        local_infile: LOAD DATA LOCAL INFILE from temp files of chunk_size rows
+                      (needs db_config['local_infile']=True and local_infile=ON on the server)
+        commit_every: commit after about this many rows, earlier chunks stay on failure
+                      None -> one transaction
+        progress: called with the number of rows sent so far
+        """
+        if not isinstance(columns, str):
+            columns = ', '.join(map(str, columns))
+
+        done = 0
+        uncommitted = 0
+        def sent(n):
+            nonlocal done, uncommitted
+            done += n
+            uncommitted += n
+            if commit_every and uncommitted >= commit_every:
+                self.commit()
+                uncommitted = 0
+            if progress:
+                progress(done)
+
+        try:
+            if local_infile:
+                query = f"LOAD DATA LOCAL INFILE %s {'IGNORE ' if ignore else ''}INTO TABLE {table} " \
+                        "CHARACTER SET utf8mb4 FIELDS TERMINATED BY '\\t' ESCAPED BY '\\\\' " \
+                        f"LINES TERMINATED BY '\\n' ({columns})"
+                for chunk in iter_chunks(rows, chunk_size):
+                    with tempfile.NamedTemporaryFile('wb', suffix='.tsv', delete=False) as f:
+                        f.writelines(self.infile_line(row) for row in chunk)
+                    try:
+                        self.cursor.execute(query, (f.name,))
+                    finally:
+                        os.remove(f.name)
+                    sent(len(chunk))
+            else:
+                head = f"INSERT {'IGNORE ' if ignore else ''}INTO {table}({columns}) VALUES "
+                self._insert_packed(head, '', rows, max_packet, lambda n, rowcount: sent(n))
+            self.commit()
+            return done
+        except Exception as e:
+            self.DB.rollback()
+            print("BULK INSERT ERR", e)
+            return False
+
+    @pooled
+    def upsert_many(self, table:str, columns:Union[str, list], rows:Iterable, conflict_keys:Union[str, list]=None, 
+                    update_columns:Union[str, list]=None, max_packet:int=None, commit_every:int=None, 
+                    progress:Callable[[int], None]=None) -> Union[dict, bool]:
+        """
+        insert rows or update them on a duplicate unique key, packed like bulk_insert
+        returns {'inserted': n, 'updated': n, 'unchanged': n} or False (rolled back)
+
+        conflict_keys: unique key columns, MariaDB matches on every unique key of the table
+                       so they only pick the default update_columns
+        update_columns: columns overwritten on duplicates (default: columns - conflict_keys)
+        counts come from affected rows (1 per insert, 2 per changed row, 0 per unchanged row)
+        and the `Duplicates: n` the server reports for multi-row INSERTs
+        """
+        columns = self._column_list(columns)
+        keys = self._column_list(conflict_keys or [])
+        if update_columns is None:
+            update_columns = [c for c in columns if c not in keys]
+        else:
+            update_columns = self._column_list(update_columns)
+        # nothing to update -> keep the row, still no duplicate key error
+        updates = ', '.join(f'{c}=VALUES({c})' for c in update_columns) or f'{columns[0]}={columns[0]}'
+
+        head = f"INSERT INTO {table}({', '.join(columns)}) VALUES "
+        tail = f' ON DUPLICATE KEY UPDATE {updates}'
+        result = {'inserted': 0, 'updated': 0, 'unchanged': 0}
+        found_rows = bool(getattr(self.DB, 'client_flag', 0) & CLIENT.FOUND_ROWS)
+        uncommitted = 0
+        def sent(n, rowcount):
+            nonlocal uncommitted
+            inserted, updated = self._upsert_counts(n, rowcount, self._duplicates(self.cursor), found_rows)
+            result['inserted'] += inserted
+            result['updated'] += updated
+            result['unchanged'] += n - inserted - updated
+            uncommitted += n
+            if commit_every and uncommitted >= commit_every:
+                self.commit()
+                uncommitted = 0
+            if progress:
+                progress(result['inserted'] + result['updated'] + result['unchanged'])
+
+        try:
+            self._insert_packed(head, tail, rows, max_packet, sent)
+            self.commit()
+            return result
+        except Exception as e:
+            self.DB.rollback()
+            print("UPSERT ERR", e)
+            return False
+
+    @staticmethod
+    def _duplicates(cursor) -> Union[int, None]:
+        """
+        `Records: n  Duplicates: n  Warnings: n` info of the last statement, None when not sent
+        """
+        message = getattr(getattr(cursor, '_result', None), 'message', None) or b''
+        if isinstance(message, bytes):
+            message = message.decode(errors='replace')
+        match = re.search(r'Duplicates:\s*(\d+)', message)
+        return int(match.group(1)) if match else None
+
+    @staticmethod
+    def _upsert_counts(n:int, affected:int, duplicates:Union[int, None], found_rows:bool) -> tuple[int, int]:
+        """
+        (inserted, updated) of one ON DUPLICATE KEY UPDATE statement over n rows
+        affected = inserted + 2 * updated (+ unchanged with CLIENT.FOUND_ROWS)
+        duplicates = updated (+ unchanged with CLIENT.FOUND_ROWS)
+        """
+        if duplicates is None:
+            # single row statements carry no info, affected rows alone tell
+            # (with CLIENT.FOUND_ROWS an unchanged row looks like an insert)
+            updated = min(max(affected - n, 0), n)
+            return (n - updated if found_rows else affected - 2 * updated), updated
+        if found_rows:
+            return n - duplicates, affected - n
+        return affected - 2 * duplicates, duplicates
+
+    def _insert_packed(self, head:str, tail:str, rows:Iterable, max_packet:int, 
+                       sent:Callable[[int, int], None]) -> None:
+        """
+        escape rows into `head (..),(..) tail` statements under the packet limit
+        sent(rows, affected rows) after each statement
+        """
+        budget = self._packet_budget(max_packet) - len(head) - len(tail)
+        values, size = [], 0
+        for row in rows:
+            value = self.DB.escape(tuple(row))
+            n = len(value.encode()) + 1
+            if values and size + n > budget:
+                self.cursor.execute(head + ','.join(values) + tail)
+                sent(len(values), self.cursor.rowcount)
+                values, size = [], 0
+            values.append(value)
+            size += n
+        if values:
+            self.cursor.execute(head + ','.join(values) + tail)
+            sent(len(values), self.cursor.rowcount)
+
+    @staticmethod
+    def _column_list(columns:Union[str, list]) -> list[str]:
+        if isinstance(columns, str):
+            return [c.strip() for c in columns.split(',') if c.strip()]
+        return list(columns)
+
+    def _packet_budget(self, max_packet:int=None) -> int:
+        """
+        statement size limit, a little under max_allowed_packet
+        """
+        with self.DB.cursor() as cursor:
+            cursor.execute('SELECT @@max_allowed_packet')
+            server_packet = int(cursor.fetchone()[0])
+        packet = min(max_packet, server_packet) if max_packet else server_packet
+        return packet - 1024
+
+    @staticmethod
+    def infile_value(value) -> bytes:
+        """
+        python value -> LOAD DATA field (tab separated, backslash escaped)
+        """
+        if value is None:
+            return b'\\N'
+        if isinstance(value, bool):
+            return b'1' if value else b'0'
+        if isinstance(value, (bytes, bytearray, memoryview)):
+            value = bytes(value)
+        else:
+            value = str(value).encode()
+        return value.replace(b'\\', b'\\\\').replace(b'\t', b'\\t').replace(b'\n', b'\\n') \
+                    .replace(b'\r', b'\\r').replace(b'\0', b'\\0')
+
+    @classmethod
+    def infile_line(cls, row) -> bytes:
+        return b'\t'.join(map(cls.infile_value, row)) + b'\n'
+
     def update(self, table:str, set_columns:list[str], set_values:list[str], where_column:str, where_value) -> bool:
         """
         Update
@@ -214,6 +436,7 @@ class MariaDB(Database):
         
         return super().delete(sql)
     
+    @pooled
     def truncate(self, table:str, forcing=True) -> bool:
         """
         truncate table
@@ -227,6 +450,7 @@ class MariaDB(Database):
         
     # Procedure
     # unavailable
+    @pooled
     def make_procedure(self, sp_name:str, inputs:list[tuple], outputs: list[tuple], variables:list[tuple], queries:list[tuple],):
         """
         inputs: [(input_name, dtype)]
@@ -286,6 +510,7 @@ class MariaDB(Database):
     # _progress, _quantity, _total_amount, _cal_amount,_buyer_name,_buyer_phone, _receiver_name, _receiver_phone, \
     # _receiver_address, _PCC')])
     
+    @pooled
     def call_procedure(self, sp_name:str, inputs:list, outputs:list[str]=['RESULT']):
         output_str = (',' + ','.join(['@'+output for output in outputs])) if outputs else ''
 
@@ -1,18 +1,23 @@
+import io
+import json
+import uuid
+
 try:
     import psycopg2
-    from psycopg2.extras import RealDictCursor
+    from psycopg2.extras import RealDictCursor, execute_values
 except:
     print('you need to install psycopg2\n$ : python -m pip install psycopg2')
 
-from typing import Iterable
+from typing import Iterable, Iterator, Union
 
-from sosin.databases.db import Database
+from sosin.databases.db import Database, iter_chunks, pooled
 
 class PostgreSQL(Database):
 
-    def __init__(self, db_config, cursor_type:str = None):
+    def __init__(self, db_config, cursor_type:str = None, pool:Union[bool, dict] = None):
         """
         cursor_type = 'dict' or None
+        pool = True or ConnectionPool options (min_size, max_size, timeout, ...)
         """
         db_config['port'] = int(db_config.get('port', '5432'))
         db_config['dbname'] = db_config.pop('database')
@@ -23,12 +28,27 @@ class PostgreSQL(Database):
         else:
             cursor_type = None
 
-        super().__init__(db_config, cursor_type)
+        super().__init__(db_config, cursor_type, pool)
+
+    def _new_connection(self):
+        return psycopg2.connect(**self.db_config)
+
+    def _new_cursor(self, conn):
+        return conn.cursor(cursor_factory=self.cursor_type)
 
-    def connect(self):
-        self.DB = psycopg2.connect(**self.db_config)
-        self.cursor = self.DB.cursor(self.cursor_type)
-        return self
+    def _server_cursor(self, conn, batch_size:int):
+        # named cursor -> DECLARE ... CURSOR, rows come itersize at a time
+        cursor = conn.cursor(name=f'sosin_stream_{uuid.uuid4().hex}', cursor_factory=self.cursor_type)
+        cursor.itersize = batch_size
+        return cursor
+
+    def _ping(self, conn) -> bool:
+        if conn.closed:
+            return False
+        with conn.cursor() as cursor:
+            cursor.execute('SELECT 1')
+        conn.rollback()
+        return True
     
     def custom_select(self, qry):
         return super().select(qry)
@@ -37,6 +57,20 @@ class PostgreSQL(Database):
         """
         table -> should be schema_name.table_name
         """
+        query = self.select_query(table, columns, where_info, order_by, page_info)
+        return super().select(query)
+
+    def iter_select(self, table, columns, where_info=None, order_by=None, page_info=None, 
+                    batch_size=1000, chunked=False) -> Iterator:
+        """
+        same as select, but rows are streamed from a named (server-side) cursor
+        batch_size: rows fetched per round trip (itersize)
+        chunked: yield lists of rows
+        """
+        query = self.select_query(table, columns, where_info, order_by, page_info)
+        return self.stream(query, batch_size=batch_size, chunked=chunked)
+
+    def select_query(self, table, columns, where_info=None, order_by=None, page_info=None) -> str:
         query = ''
 
         if not isinstance(columns, str) and isinstance(columns, Iterable):
@@ -53,7 +87,7 @@ class PostgreSQL(Database):
         if page_info:
             query += self.pagination(*page_info)
 
-        return super().select(query)
+        return query
     
     # where equal
     # where between
@@ -93,10 +127,171 @@ class PostgreSQL(Database):
         
         assert len(values[0]) == columns.count(',')+1, "칼럼 길이와 값의 길이가 다릅니다. ,를 확인해주세요"
 
-        value_qry = ','.join(['%s'] * len(values[0]))
-        query = f'INSERT INTO {table}({columns}) VALUES ({value_qry});'
+        # execute_values packs page_size rows per INSERT instead of one round trip per row
+        return self.bulk_insert(table, columns, values, use_copy=False) is not False
+
+    @pooled
+    def bulk_insert(self, table, columns, rows, chunk_size=10000, use_copy=True, page_size=1000) -> Union[int, bool]:
+        """
+        load many rows in one transaction, returns the number of rows or False (rolled back)
+
+        rows -> any iterable of tuples (generators are fine), read chunk_size rows at a time
+        use_copy: COPY ... FROM STDIN in text format, one in-memory buffer per chunk
+        use_copy=False: execute_values with page_size rows per INSERT
+                        (views, triggers relying on INSERT, ...)
+        """
+        if not isinstance(columns, str) and isinstance(columns, Iterable):
+            columns = ', '.join(map(str, columns))
+
+        try:
+            count = 0
+            if use_copy:
+                query = f'COPY {table} ({columns}) FROM STDIN'
+                for chunk in iter_chunks(rows, chunk_size):
+                    buffer = io.StringIO()
+                    buffer.writelines(self.copy_line(row) for row in chunk)
+                    buffer.seek(0)
+                    self.cursor.copy_expert(query, buffer, size=65536)
+                    count += len(chunk)
+            else:
+                query = f'INSERT INTO {table}({columns}) VALUES %s'
+                for chunk in iter_chunks(rows, chunk_size):
+                    execute_values(self.cursor, query, chunk, page_size=page_size)
+                    count += len(chunk)
+            self.commit()
+            return count
+        except Exception as e:
+            self.DB.rollback()
+            print("BULK INSERT ERR", e)
+            return False
+
+    @pooled
+    def upsert_many(self, table, columns, rows, conflict_keys, update_columns=None, 
+                    chunk_size=10000, use_copy=True, page_size=1000) -> Union[dict, bool]:
+        """
+        INSERT ... ON CONFLICT (conflict_keys) DO UPDATE in batches
+        returns {'inserted': n, 'updated': n, 'unchanged': n} or False (rolled back)
+
+        conflict_keys: columns of a unique index / constraint
+        update_columns: columns overwritten on conflict (default: columns - conflict_keys),
+                        empty -> DO NOTHING, skipped rows count as unchanged
+                        (DO UPDATE rewrites identical rows too, they count as updated)
+        use_copy: COPY each chunk into a temp table and upsert from it in one statement
+        use_copy=False: execute_values with page_size rows per statement
+        a key may appear only once per chunk (ON CONFLICT can't touch a row twice)
+        """
+        columns = self._column_list(columns)
+        keys = self._column_list(conflict_keys)
+        if update_columns is None:
+            update_columns = [c for c in columns if c not in keys]
+        else:
+            update_columns = self._column_list(update_columns)
+
+        column_qry = ', '.join(columns)
+        if update_columns:
+            action = 'DO UPDATE SET ' + ', '.join(f'{c}=EXCLUDED.{c}' for c in update_columns)
+        else:
+            action = 'DO NOTHING'
+        conflict = f"ON CONFLICT ({', '.join(keys)}) {action}"
+        # xmax is 0 only on freshly inserted row versions
+        def counted(source):
+            return f'WITH upserted AS (INSERT INTO {table} ({column_qry}) {source} {conflict} ' \
+                    'RETURNING (xmax = 0) AS inserted) ' \
+                    'SELECT count(*) FILTER (WHERE inserted) AS inserted, ' \
+                    'count(*) FILTER (WHERE NOT inserted) AS updated FROM upserted'
+
+        result = {'inserted': 0, 'updated': 0, 'unchanged': 0}
+        total = 0
+        def add(counts):
+            for row in counts:
+                inserted, updated = row.values() if isinstance(row, dict) else row
+                result['inserted'] += inserted
+                result['updated'] += updated
+
+        try:
+            if use_copy:
+                temp = f'_sosin_upsert_{uuid.uuid4().hex[:12]}'
+                # column types only, no defaults (sequences) or constraints
+                self.cursor.execute(f'CREATE TEMP TABLE {temp} ON COMMIT DROP AS '
+                                    f'SELECT {column_qry} FROM {table} WITH NO DATA')
+                query = counted(f'SELECT {column_qry} FROM {temp}')
+                for chunk in iter_chunks(rows, chunk_size):
+                    buffer = io.StringIO()
+                    buffer.writelines(self.copy_line(row) for row in chunk)
+                    buffer.seek(0)
+                    self.cursor.copy_expert(f'COPY {temp} ({column_qry}) FROM STDIN', buffer, size=65536)
+                    total += len(chunk)
+                    self.cursor.execute(query)
+                    add(self.cursor.fetchall())
+                    self.cursor.execute(f'TRUNCATE {temp}')
+            else:
+                query = counted('VALUES %s')
+                for chunk in iter_chunks(rows, chunk_size):
+                    add(execute_values(self.cursor, query, chunk, page_size=page_size, fetch=True))
+                    total += len(chunk)
+            result['unchanged'] = total - result['inserted'] - result['updated']
+            self.commit()
+            return result
+        except Exception as e:
+            self.DB.rollback()
+            print("UPSERT ERR", e)
+            return False
+
+    @staticmethod
+    def _column_list(columns) -> list:
+        if isinstance(columns, str):
+            return [c.strip() for c in columns.split(',') if c.strip()]
+        return list(columns)
+
+    @staticmethod
+    def copy_value(value) -> str:
+        """
+        python value -> COPY text format field
+        None -> NULL, list -> array (like execute_values), dict -> json, datetime -> isoformat
+        a list for a json column has to be passed as json.dumps(value)
+        """
+        if value is None:
+            return '\\N'
+        if isinstance(value, bool):
+            return 't' if value else 'f'
+        if isinstance(value, (bytes, bytearray, memoryview)):
+            # bytea hex input, backslash escaped for the text format
+            return '\\\\x' + bytes(value).hex()
+        if isinstance(value, list):
+            value = PostgreSQL.array_literal(value)
+        elif isinstance(value, dict):
+            value = json.dumps(value, ensure_ascii=False)
+        elif not isinstance(value, str):
+            value = value.isoformat() if hasattr(value, 'isoformat') else str(value)
+        return value.replace('\\', '\\\\').replace('\t', '\\t').replace('\n', '\\n').replace('\r', '\\r')
+
+    @staticmethod
+    def array_literal(values:list) -> str:
+        """
+        python list -> array input ({1,2} / {"a","b"} / {{1,2},{3,4}}), every element quoted
+        """
+        elements = []
+        for value in values:
+            if value is None:
+                elements.append('NULL')
+                continue
+            if isinstance(value, list):
+                elements.append(PostgreSQL.array_literal(value))
+                continue
+            if isinstance(value, bool):
+                value = 't' if value else 'f'
+            elif isinstance(value, (bytes, bytearray, memoryview)):
+                value = '\\x' + bytes(value).hex()
+            elif isinstance(value, dict):
+                value = json.dumps(value, ensure_ascii=False)
+            elif not isinstance(value, str):
+                value = value.isoformat() if hasattr(value, 'isoformat') else str(value)
+            elements.append('"' + value.replace('\\', '\\\\').replace('"', '\\"') + '"')
+        return '{' + ','.join(elements) + '}'
 
-        return super().insert_many(query, values)
+    @classmethod
+    def copy_line(cls, row) -> str:
+        return '\t'.join(map(cls.copy_value, row)) + '\n'
     
     def update(self, table, columns, values, where_info) -> bool:
         assert len(columns) == len(values), "칼럼 길이와 값의 길이가 다릅니다."
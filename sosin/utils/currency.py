@@ -1,8 +1,4 @@
 import requests
-try:
-    from bs4 import BeautifulSoup
-except:
-    print('you need to install BeautifulSoup4\n$ : python -m pip install BeautifulSoup4')
 
 country_list = [
     '미국', '유럽연합', '일본', '중국', '홍콩', '대만', '영국', '오만', '캐나다', 
@@ -41,6 +37,8 @@ symbol_to_name = {
 }
 
 def get_currency(symbol):
+    from sosin.web.parse import Select, parse, strainer
+
     symbol = symbol.upper()
     if symbol == 'KRW'or symbol =='한국':
         return 1.0
@@ -52,5 +50,6 @@ def get_currency(symbol):
     else:
         name = name_to_symbol[symbol]
     r = requests.get(f'https://www.google.com/search?q={name}환율')
-    sp = BeautifulSoup(r.text, 'html.parser')
-    return float(sp.select_one('.BNeawe.iBp4i.AP7Wnd').text.split()[0].replace(',', ''))
+    # only the rate element is built, not the whole result page
+    sp = parse(r.text, strainer(class_='iBp4i'))
+    return float(Select('.BNeawe.iBp4i.AP7Wnd', one=True)(sp).split()[0].replace(',', ''))
@@ -1,12 +1,108 @@
+import base64
+import json
+import threading
+import time
+
+from collections import deque
+
+
+class HistoryRecord:
+    """
+    compact request history entry
+    body is kept only when HistoryManager(keep_body=True)
+    """
+
+    __slots__ = ('method', 'url', 'status', 'elapsed', 'request_bytes', 'response_bytes', 'timestamp', 'body')
+
+    def __init__(self, method:str, url:str, status:int, elapsed:float, 
+                 request_bytes:int, response_bytes:int, timestamp:float, body:bytes=None) -> None:
+        self.method = method
+        self.url = url
+        self.status = status
+        self.elapsed = elapsed
+        self.request_bytes = request_bytes
+        self.response_bytes = response_bytes
+        self.timestamp = timestamp
+        self.body = body
+
+    def to_dict(self) -> dict:
+        d = {k: getattr(self, k) for k in self.__slots__[:-1]}
+        if self.body is not None:
+            d['body'] = base64.b64encode(self.body).decode()
+        return d
+
+    def __repr__(self) -> str:
+        return f'<HistoryRecord {self.method} {self.url} [{self.status}] {self.elapsed:.3f}s>'
+
+
 class HistoryManager:
+    """
+    request history as a ring buffer of HistoryRecord
+
+    max_size: records kept in memory, None -> unbounded
+    keep_body: keep response bodies in records
+    sink_path: also append every record to this JSONL file
+    """
 
-    history: list
+    history: deque
     
-    def __init__(self) -> None:
-        self.history = []
+    def __init__(self, max_size:int=1000, keep_body:bool=False, sink_path:str=None) -> None:
+        self.history = deque(maxlen=max_size)
+        self.keep_body = keep_body
+        self.sink_path = sink_path
+        self._sink = open(sink_path, 'a', encoding='UTF-8') if sink_path else None
+        self._lock = threading.Lock()
+
+    def __del__(self):
+        self.close()
     
     def add_history(self, r):
-        self.history.append(r)
+        record = self.make_record(r, self.keep_body)
+        with self._lock:
+            self.history.append(record)
+            if self._sink is not None:
+                self._sink.write(json.dumps(record.to_dict(), ensure_ascii=False) + '\n')
+                self._sink.flush()
+
+    def get_histories(self) -> list[HistoryRecord]:
+        with self._lock:
+            return list(self.history)
+
+    def close(self):
+        sink = getattr(self, '_sink', None)
+        if sink is not None:
+            sink.close()
+            self._sink = None
+
+    @staticmethod
+    def make_record(r, keep_body:bool=False) -> HistoryRecord:
+        """
+        requests.Response / httpx.Response -> HistoryRecord
+        """
+        request = r.request
+        try:
+            elapsed = r.elapsed.total_seconds()
+        except RuntimeError:
+            # httpx stream not closed yet
+            elapsed = 0.0
+
+        if hasattr(r, 'num_bytes_downloaded'):
+            # httpx
+            try:
+                request_bytes = len(request.content)
+            except Exception:
+                request_bytes = int(request.headers.get('content-length') or 0)
+            response_bytes = r.num_bytes_downloaded
+            body = r.content if keep_body and r.is_closed else None
+        else:
+            body = request.body
+            if isinstance(body, (bytes, str)):
+                request_bytes = len(body)
+            else:
+                request_bytes = int(request.headers.get('content-length') or 0)
+            consumed = r._content_consumed
+            response_bytes = len(r.content) if consumed else int(r.headers.get('content-length') or 0)
+            body = r.content if keep_body and consumed else None
 
-    def get_histories(self):
-        return self.history
\ No newline at end of file
+        return HistoryRecord(request.method, str(r.url), r.status_code, elapsed, 
+                             request_bytes, response_bytes, time.time(), body)
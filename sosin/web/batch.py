@@ -0,0 +1,34 @@
+from typing import Any, Union
+
+
+class BatchResult:
+    """
+    Result of one request in a batch
+    error is set (and response is None) when the request raised
+    """
+
+    __slots__ = ('index', 'request', 'response', 'error')
+
+    def __init__(self, index:int, request:dict, response:Any=None, error:Exception=None) -> None:
+        self.index = index
+        self.request = request
+        self.response = response
+        self.error = error
+
+    @property
+    def ok(self) -> bool:
+        return self.error is None
+
+    def __repr__(self) -> str:
+        state = self.response if self.ok else repr(self.error)
+        return f'<BatchResult [{self.index}] {self.request.get("url")} {state}>'
+
+
+def make_request(item:Union[str, dict], method:str='get') -> dict:
+    """
+    batch item -> _request kwargs
+    item = 'https://...' or {'url': 'https://...', 'method': 'post', 'data': {...}}
+    """
+    if isinstance(item, str):
+        return {'url': item, 'method': method}
+    return {'method': method, **item}
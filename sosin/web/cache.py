@@ -0,0 +1,260 @@
+import hashlib
+import os
+import pickle
+import threading
+import time
+
+from collections import OrderedDict
+from email.utils import parsedate_to_datetime
+from typing import Optional
+from urllib.parse import urlencode
+
+# body encoding is already undone by the client, the length is recomputed
+DROP_HEADERS = ('content-encoding', 'content-length', 'transfer-encoding')
+
+
+class CacheEntry:
+    """
+    cached GET response
+    """
+
+    __slots__ = ('url', 'status', 'headers', 'content', 'expires_at', 'vary')
+
+    def __init__(self, url:str, status:int, headers:dict, content:bytes, expires_at:float, 
+                 vary:dict=None) -> None:
+        self.url = url
+        self.status = status
+        self.headers = headers
+        self.content = content
+        self.expires_at = expires_at
+        # request header -> value the response was negotiated for (Vary)
+        self.vary = vary or {}
+
+    @property
+    def size(self) -> int:
+        return len(self.content) + sum(len(k) + len(v) for k, v in self.headers.items())
+
+    @property
+    def fresh(self) -> bool:
+        return time.time() < self.expires_at
+
+    @property
+    def validators(self) -> dict:
+        """
+        conditional request headers for revalidation
+        """
+        headers = {}
+        if 'etag' in self.headers:
+            headers['if-none-match'] = self.headers['etag']
+        if 'last-modified' in self.headers:
+            headers['if-modified-since'] = self.headers['last-modified']
+        return headers
+
+    def matches(self, request_headers:dict) -> bool:
+        """
+        request asks for the same variant (headers named by Vary)
+        """
+        return all(_header(request_headers, name) == value for name, value in self.vary.items())
+
+
+def _header(headers:dict, name:str) -> Optional[str]:
+    for k, v in (headers or {}).items():
+        if k.lower() == name:
+            return v
+    return None
+
+
+class ResponseCache:
+    """
+    HTTP response cache for GET requests
+    in-memory LRU bounded by max_size bytes, optionally backed by files in cache_dir
+
+    freshness follows Cache-Control (no-store, no-cache, max-age) and Expires
+    stale entries with ETag / Last-Modified are revalidated, a 304 is served from cache
+    Vary: one variant per url, served only to requests with the same values of the Vary headers
+    default_ttl: seconds of freshness for responses without caching headers
+    """
+
+    def __init__(self, max_size:int=64 * 1024 * 1024, cache_dir:str=None, default_ttl:float=0) -> None:
+        self.max_size = max_size
+        self.cache_dir = cache_dir
+        self.default_ttl = default_ttl
+        if cache_dir:
+            os.makedirs(cache_dir, exist_ok=True)
+
+        self._entries = OrderedDict()
+        self._size = 0
+        self._lock = threading.Lock()
+
+        self.hits = 0
+        self.misses = 0
+        self.revalidations = 0
+        self.bytes_saved = 0
+
+    # ------------------------------------------------------------------------
+    # Lookup
+    @staticmethod
+    def make_key(url:str, params:dict=None) -> str:
+        if params:
+            url += ('&' if '?' in url else '?') + urlencode(sorted(params.items()), doseq=True)
+        return url
+
+    def lookup(self, key:str, request_headers:dict=None) -> tuple[Optional[CacheEntry], bool]:
+        """
+        (cached entry or None, is fresh), fresh entries count as hits
+        request_headers: headers of the request, checked against the entry's Vary
+        """
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                self._entries.move_to_end(key)
+        if entry is None and self.cache_dir:
+            entry = self._read(key)
+            if entry is not None:
+                self._remember(key, entry)
+        if entry is not None and not entry.matches(request_headers):
+            # another variant, the response of this request replaces it
+            entry = None
+        fresh = entry is not None and entry.fresh
+        if fresh:
+            with self._lock:
+                self.hits += 1
+                self.bytes_saved += len(entry.content)
+        return entry, fresh
+
+    # ------------------------------------------------------------------------
+    # Store
+    def store(self, key:str, url:str, status:int, headers:dict, content:bytes, 
+              request_headers:dict=None) -> Optional[CacheEntry]:
+        """
+        store a full response, counts as a miss
+        request_headers: headers of the request, the values of those named by Vary are kept
+        """
+        with self._lock:
+            self.misses += 1
+
+        headers = {k.lower(): v for k, v in headers.items() if k.lower() not in DROP_HEADERS}
+        expires_at = self._expires_at(headers)
+        vary = [name.strip().lower() for name in headers.get('vary', '').split(',') if name.strip()]
+        # never fresh and nothing to revalidate with, it would only evict useful entries
+        useless = expires_at is not None and expires_at <= time.time() \
+            and 'etag' not in headers and 'last-modified' not in headers
+        if status != 200 or expires_at is None or '*' in vary or useless:
+            self.discard(key)
+            return None
+
+        vary = {name: _header(request_headers, name) for name in vary}
+        entry = CacheEntry(url, status, headers, content, expires_at, vary)
+        self._remember(key, entry)
+        if self.cache_dir:
+            self._write(key, entry)
+        return entry
+
+    def revalidated(self, key:str, entry:CacheEntry, headers:dict) -> CacheEntry:
+        """
+        304 Not Modified -> refresh headers and freshness of the cached entry
+        """
+        updated = {k.lower(): v for k, v in headers.items() if k.lower() not in DROP_HEADERS}
+        entry.headers = {**entry.headers, **updated}
+        expires_at = self._expires_at(entry.headers)
+        entry.expires_at = expires_at if expires_at is not None else time.time()
+
+        with self._lock:
+            self.revalidations += 1
+            self.bytes_saved += len(entry.content)
+        if self.cache_dir:
+            self._write(key, entry)
+        return entry
+
+    def discard(self, key:str) -> None:
+        with self._lock:
+            entry = self._entries.pop(key, None)
+            if entry is not None:
+                self._size -= entry.size
+        if self.cache_dir:
+            try:
+                os.remove(self._path(key))
+            except OSError:
+                ...
+
+    def clear(self) -> None:
+        with self._lock:
+            keys = list(self._entries)
+        for key in keys:
+            self.discard(key)
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {'hits': self.hits, 'misses': self.misses, 
+                    'revalidations': self.revalidations, 'bytes_saved': self.bytes_saved, 
+                    'entries': len(self._entries), 'size': self._size}
+
+    def _remember(self, key:str, entry:CacheEntry) -> None:
+        size = entry.size
+        if size > self.max_size:
+            return
+        with self._lock:
+            old = self._entries.pop(key, None)
+            if old is not None:
+                self._size -= old.size
+            self._entries[key] = entry
+            self._size += size
+            # evict least recently used until it fits
+            while self._size > self.max_size:
+                _, evicted = self._entries.popitem(last=False)
+                self._size -= evicted.size
+
+    def _expires_at(self, headers:dict) -> Optional[float]:
+        """
+        None -> must not be stored
+        """
+        now = time.time()
+        directives = {}
+        for directive in headers.get('cache-control', '').split(','):
+            k, _, v = directive.strip().partition('=')
+            if k:
+                directives[k.lower()] = v.strip('"')
+
+        if 'no-store' in directives:
+            return None
+        if 'no-cache' in directives:
+            return now
+        if 'max-age' in directives:
+            try:
+                return now + int(directives['max-age']) - int(headers.get('age', 0))
+            except ValueError:
+                return now
+        if 'expires' in headers:
+            try:
+                expires = parsedate_to_datetime(headers['expires']).timestamp()
+                date = parsedate_to_datetime(headers['date']).timestamp() if 'date' in headers else now
+                return now + expires - date
+            except (TypeError, ValueError):
+                # invalid Expires (e.g. "0") means already expired
+                return now
+        return now + self.default_ttl
+
+    # ------------------------------------------------------------------------
+    # Disk Store
+    def _path(self, key:str) -> str:
+        return os.path.join(self.cache_dir, hashlib.sha1(key.encode()).hexdigest())
+
+    def _read(self, key:str) -> Optional[CacheEntry]:
+        try:
+            with open(self._path(key), 'rb') as f:
+                fields = pickle.load(f)
+        except Exception:
+            return None
+        # entries written before Vary was kept have no vary field
+        return CacheEntry(*fields)
+
+    def _write(self, key:str, entry:CacheEntry) -> None:
+        path = self._path(key)
+        tmp_path = f'{path}.{os.getpid()}.{threading.get_ident()}.tmp'
+        try:
+            with open(tmp_path, 'wb') as f:
+                pickle.dump((entry.url, entry.status, entry.headers, entry.content, entry.expires_at, 
+                             entry.vary), f)
+            os.replace(tmp_path, path)
+        except OSError:
+            ...
@@ -0,0 +1,93 @@
+import asyncio
+import threading
+
+from typing import Awaitable, Callable
+from urllib.parse import urlencode
+
+# only requests without side effects are shared
+COALESCE_METHODS = frozenset(('get', 'head'))
+
+DEFAULT_KEY_HEADERS = ('authorization', 'cookie', 'accept', 'accept-language')
+
+
+def make_key(method:str, 
+             url:str, 
+             params:dict=None, 
+             headers:dict=None, 
+             cookies:dict=None, 
+             key_headers:tuple=DEFAULT_KEY_HEADERS
+             ) -> tuple:
+    """
+    requests with the same key get the same response
+    """
+    headers = {k.lower(): v for k, v in (headers or {}).items()}
+    return (method.lower(), 
+            url, 
+            urlencode(sorted((params or {}).items()), doseq=True), 
+            tuple((k, headers.get(k)) for k in key_headers), 
+            tuple(sorted((cookies or {}).items())))
+
+
+class _Call:
+
+    __slots__ = ('event', 'result', 'error')
+
+    def __init__(self) -> None:
+        self.event = threading.Event()
+        self.result = None
+        self.error = None
+
+
+class SingleFlight:
+    """
+    thread-safe request coalescing
+    the first caller of a key runs fn, callers arriving while it runs wait and share its result
+    """
+
+    def __init__(self) -> None:
+        self._calls = {}
+        self._lock = threading.Lock()
+
+    def do(self, key, fn:Callable):
+        with self._lock:
+            call = self._calls.get(key)
+            leader = call is None
+            if leader:
+                call = self._calls[key] = _Call()
+
+        if not leader:
+            call.event.wait()
+        else:
+            try:
+                call.result = fn()
+            except BaseException as e:
+                call.error = e
+            finally:
+                with self._lock:
+                    del self._calls[key]
+                call.event.set()
+
+        if call.error is not None:
+            raise call.error
+        return call.result
+
+
+class AsyncSingleFlight:
+    """
+    asyncio request coalescing
+    the shared request runs as its own task, so a cancelled caller does not cancel the others
+    """
+
+    def __init__(self) -> None:
+        self._tasks = {}
+
+    async def do(self, key, fn:Callable[[], Awaitable]):
+        task = self._tasks.get(key)
+        if task is None or task.done():
+            task = self._tasks[key] = asyncio.ensure_future(fn())
+            task.add_done_callback(lambda t: self._forget(key, t))
+        return await asyncio.shield(task)
+
+    def _forget(self, key, task:asyncio.Task) -> None:
+        if self._tasks.get(key) is task:
+            del self._tasks[key]
@@ -1,5 +1,7 @@
 import requests
 
+from .download import CHUNK_SIZE, download
+
 headers = {
     'user-agent': 'Mozilla/5.0'
 }
@@ -10,23 +12,49 @@ class WebContentManager:
     download(path)
     get_content_type() -> image/jpeg, image/png, ...
     get_body() -> binary content
+
+    stream=True does not load the body, download() then writes it to disk in chunks
     """
-    def __init__(self, url, method:str='get', add_headers:dict={}, add_body:dict={}) -> None:
+    def __init__(self, url, method:str='get', add_headers:dict={}, add_body:dict={}, stream:bool=False) -> None:
+        self.url = url
+        self.headers = {**headers, **add_headers}
+        self.session = requests.Session()
+        self.r = None
+        if stream:
+            assert method.lower() == 'get', 'stream mode supports get only'
+            return
+
         if method.lower()=='get':
-            r = requests.get(url, headers={**headers, **add_headers})
+            r = self.session.get(url, headers=self.headers)
         else:
-            r = requests.post(url, headers={**headers, **add_headers}, body=add_body)
+            r = self.session.post(url, headers=self.headers, body=add_body)
         r.raise_for_status()
         self.r = r
 
-    def download(self, file_path:str):
+    def download(self, file_path:str, chunk_size:int=CHUNK_SIZE, resume:bool=True, parts:int=1):
+        """
+        stream mode
+        resume: continue an interrupted download (file_path.part) with a Range request
+        parts: number of byte ranges fetched concurrently (needs Accept-Ranges)
+        """
+        if self.r is None:
+            return download(self.session, self.url, file_path, 
+                            parts=parts, chunk_size=chunk_size, resume=resume, headers=self.headers)
+
         with open(file_path, 'wb') as f:
             f.write(self.get_body())
     
     def get_content_type(self):
+        if self.r is None:
+            r = self.session.head(self.url, headers=self.headers, allow_redirects=True)
+            return r.headers['content-type']
         return self.r.headers['content-type']
     
     def get_body(self):
+        if self.r is None:
+            r = self.session.get(self.url, headers=self.headers)
+            r.raise_for_status()
+            return r.content
         return self.r.content
 
 if __name__ == '__main__':
@@ -1,46 +1,206 @@
+import os
+import threading
 from typing import Union
+from urllib.parse import urlsplit
 import requests
 import httpx
 
+# parsed cookie files shared by every manager in the process
+# path -> (mtime, {(domain, path, name): value})
+_cookie_files = {}
+_cookie_files_lock = threading.Lock()
+
+
+def _parse_cookie_file(cookie_path:str) -> tuple[float, dict]:
+    """
+    lines are `name=value` (any host) or `name=value; Domain=.example.com; Path=/`
+    """
+    mtime = os.path.getmtime(cookie_path)
+    with _cookie_files_lock:
+        cached = _cookie_files.get(cookie_path)
+        if cached and cached[0] == mtime:
+            return cached
+
+    jar = {}
+    with open(cookie_path, 'r') as f:
+        for l in f.readlines():
+            l = l.rstrip('\r\n')
+            if '=' not in l:
+                continue
+            pair, *attrs = l.split('; ')
+            _idx = pair.index('=')
+            domain, path = '', '/'
+            for attr in attrs:
+                k, _, v = attr.partition('=')
+                if k.lower() == 'domain':
+                    domain = v
+                elif k.lower() == 'path':
+                    path = v or '/'
+            jar[(domain, path, pair[:_idx])] = pair[_idx+1:]
+
+    with _cookie_files_lock:
+        _cookie_files[cookie_path] = (mtime, jar)
+    return mtime, jar
+
+
+def _domain_match(host:str, domain:str) -> bool:
+    if not domain:
+        return True
+    if domain.startswith('.'):
+        return host == domain[1:] or host.endswith(domain)
+    return host == domain
+
+
 class CookieManager:
+    """
+    Cookie Manager
+    cookies are kept per (domain, path, name), cookies without a domain go to every host
+
+    changes are written behind: the file is rewritten atomically (temp file + rename)
+    at most once every `save_delay` seconds, and once more when the manager is deleted
+    """
 
     _cookies:dict
     
-    def __init__(self, cookie_path:str='./cookie') -> None:
+    def __init__(self, cookie_path:str='./cookie', save_delay:float=1.0) -> None:
         self._cookie_path = cookie_path
+        self._save_delay = save_delay
+        # (domain, path, name) -> value
+        self._jar = {}
+        # name -> value of the last cookie set with that name
         self._cookies = {}
+        # (domain, path, name) this manager deleted, kept out of the merge with the file
+        self._removed = set()
+        # guards the jar when responses are merged from several threads
+        self._cookie_lock = threading.RLock()
+        self._dirty = False
+        self._save_timer = None
+        self._loaded_mtime = None
 
         try:
-            open(cookie_path, 'r')
             self._load_cookies()
         except: pass
 
     def __del__(self):
         self._save_cookies()
         
-    def add_cookies(self, cookies:dict) -> None:
-        self._cookies.update(cookies)
+    def add_cookies(self, cookies:dict, domain:str='', path:str='/') -> None:
+        with self._cookie_lock:
+            for k, v in cookies.items():
+                self._put(domain, path, k, v)
 
     def get_cookie(self, k:str) -> str:
         return self._cookies.get(k, '')
 
+    def cookies_for(self, url:str) -> dict:
+        """
+        cookies to send to url
+        """
+        parts = urlsplit(url)
+        host = parts.hostname or ''
+        req_path = parts.path or '/'
+        with self._cookie_lock:
+            # shorter paths first so the most specific cookie wins
+            matched = sorted(((path, name, value) for (domain, path, name), value in self._jar.items()
+                              if _domain_match(host, domain) and req_path.startswith(path)), 
+                             key=lambda c: len(c[0]))
+        return {name: value for _, name, value in matched}
+
     def _set_cookies(self, r:Union[requests.Response, httpx.Response]) -> None:
         if isinstance(r, requests.Response):
-            self._cookies.update(r.cookies.get_dict())
+            jar = r.cookies
         elif isinstance(r, httpx.Response):
-            self._cookies.update(dict(r.cookies))
-        ...
+            jar = r.cookies.jar
+        else:
+            return
+        cookies = [(c.domain, c.path or '/', c.name, c.value) for c in jar]
+        if cookies:
+            with self._cookie_lock:
+                for cookie in cookies:
+                    self._put(*cookie)
 
     def _reset_cookies(self, keys:list=[]) -> None:
-        self._cookies = {k: self._cookies[k] for k in keys}
+        with self._cookie_lock:
+            known = set(self._jar)
+            if self._cookie_path and os.path.exists(self._cookie_path):
+                # cookies other managers wrote since we read the file go as well
+                known.update(_parse_cookie_file(self._cookie_path)[1])
+            self._removed.update(key for key in known if key[2] not in keys)
+            self._jar = {key: v for key, v in self._jar.items() if key[2] in keys}
+            self._cookies = {k: self._cookies[k] for k in keys}
+            self._mark_dirty()
+
+    def _fill_jar(self, jar) -> None:
+        """
+        copy cookies into a requests / httpx cookie jar
+        """
+        with self._cookie_lock:
+            for (domain, path, name), value in self._jar.items():
+                jar.set(name, value, domain=domain, path=path)
+
+    def _put(self, domain:str, path:str, name:str, value:str) -> None:
+        key = (domain, path, name)
+        self._removed.discard(key)
+        if self._jar.get(key) != value:
+            self._jar[key] = value
+            self._mark_dirty()
+        self._cookies[name] = value
+
+    # ------------------------------------------------------------------------
+    # Persistence
+    def _mark_dirty(self) -> None:
+        self._dirty = True
+        if not self._cookie_path or self._save_timer is not None:
+            return
+        if self._save_delay <= 0:
+            self._save_cookies()
+            return
+        self._save_timer = threading.Timer(self._save_delay, self._save_cookies)
+        self._save_timer.daemon = True
+        self._save_timer.start()
     
     def _save_cookies(self) -> None:
         try:
-            open(self._cookie_path, 'w').write('\n'.join(['{}={}'.format(k, v) for k, v in self._cookies.items()]))
+            with self._cookie_lock:
+                timer, self._save_timer = self._save_timer, None
+                if timer is not None:
+                    timer.cancel()
+                if not self._dirty or not self._cookie_path:
+                    return
+                self._dirty = False
+                jar = dict(self._jar)
+                removed = set(self._removed)
+
+            # keep cookies another manager wrote to the same file since we read it
+            if os.path.exists(self._cookie_path):
+                mtime, on_disk = _parse_cookie_file(self._cookie_path)
+                if mtime != self._loaded_mtime:
+                    jar = {**{key: v for key, v in on_disk.items() if key not in removed}, **jar}
+
+            lines = []
+            for (domain, path, name), value in jar.items():
+                line = '{}={}'.format(name, value)
+                if domain:
+                    line += '; Domain={}; Path={}'.format(domain, path)
+                lines.append(line)
+
+            tmp_path = f'{self._cookie_path}.{os.getpid()}.{threading.get_ident()}.tmp'
+            with open(tmp_path, 'w') as f:
+                f.write('\n'.join(lines))
+            os.replace(tmp_path, self._cookie_path)
+
+            mtime = os.path.getmtime(self._cookie_path)
+            with _cookie_files_lock:
+                _cookie_files[self._cookie_path] = (mtime, jar)
+            self._loaded_mtime = mtime
         except:
             ...
         
     def _load_cookies(self) -> dict:
-        for l in open(self._cookie_path, 'r').readlines():
-            _idx = l.index('=')
-            self._cookies.update({l[:_idx]: l[_idx+1:].rstrip()})
\ No newline at end of file
+        mtime, jar = _parse_cookie_file(self._cookie_path)
+        with self._cookie_lock:
+            self._loaded_mtime = mtime
+            for (domain, path, name), value in jar.items():
+                self._jar[(domain, path, name)] = value
+                self._cookies[name] = value
+        return self._cookies
@@ -0,0 +1,376 @@
+import asyncio
+import hashlib
+import heapq
+import itertools
+import math
+import os
+import pickle
+import posixpath
+import re
+import time
+
+from typing import AsyncIterator, Callable, Iterable, Optional
+from urllib.parse import parse_qsl, urlencode, urljoin, urlsplit, urlunsplit
+
+from .batch import BatchResult
+from .session_async import AsyncSessionManager
+
+DEFAULT_PORTS = {'http': 80, 'https': 443}
+
+HREF_RE = re.compile(r'''<a\s[^>]*?href\s*=\s*["']([^"'#>]+)''', re.IGNORECASE)
+
+
+def normalize_url(url:str, base:str=None) -> Optional[str]:
+    """
+    canonical form used for dedup, None for non http(s) urls
+
+    resolve against base, lowercase scheme and host, drop default port and fragment,
+    remove dot segments and sort the query string
+    """
+    if base:
+        url = urljoin(base, url)
+    parts = urlsplit(url.strip())
+    scheme = parts.scheme.lower()
+    if scheme not in DEFAULT_PORTS or not parts.hostname:
+        return None
+
+    netloc = parts.hostname.lower()
+    if parts.port and parts.port != DEFAULT_PORTS[scheme]:
+        netloc += f':{parts.port}'
+
+    path = parts.path or '/'
+    if '.' in path:
+        trailing = path.endswith('/')
+        path = posixpath.normpath(path)
+        if trailing and path != '/':
+            path += '/'
+    query = urlencode(sorted(parse_qsl(parts.query, keep_blank_values=True)))
+    return urlunsplit((scheme, netloc, path, query, ''))
+
+
+def extract_links(r) -> list[str]:
+    """
+    href of <a> tags, relative to the response url
+    """
+    base = str(r.url)
+    return [urljoin(base, href) for href in HREF_RE.findall(r.text)]
+
+
+# ----------------------------------------------------------------------------
+# Dedup
+class BloomFilter:
+    """
+    bloom filter over 128 bit digests (double hashing)
+    """
+
+    def __init__(self, capacity:int, error_rate:float=0.001) -> None:
+        self.size = max(8, int(-capacity * math.log(error_rate) / math.log(2) ** 2))
+        self.hashes = max(1, round(self.size / capacity * math.log(2)))
+        self.bits = bytearray((self.size + 7) // 8)
+
+    def _positions(self, digest:bytes) -> Iterable[int]:
+        h1 = int.from_bytes(digest[:8], 'little')
+        h2 = int.from_bytes(digest[8:16], 'little') | 1
+        return ((h1 + i * h2) % self.size for i in range(self.hashes))
+
+    def add(self, digest:bytes) -> None:
+        for pos in self._positions(digest):
+            self.bits[pos >> 3] |= 1 << (pos & 7)
+
+    def __contains__(self, digest:bytes) -> bool:
+        return all(self.bits[pos >> 3] & (1 << (pos & 7)) for pos in self._positions(digest))
+
+
+class SeenSet:
+    """
+    visited url set
+
+    exact (set of 16 byte digests, no full strings) up to exact_limit urls,
+    then the digests move into a bloom filter sized for `capacity` urls at `error_rate`
+    false positives (a new url reported as seen) only happen in bloom mode
+    """
+
+    def __init__(self, capacity:int=10_000_000, error_rate:float=0.001, exact_limit:int=100_000) -> None:
+        self.capacity = capacity
+        self.error_rate = error_rate
+        self.exact_limit = exact_limit
+        self._exact = set()
+        self._bloom = None
+        self._count = 0
+
+    @staticmethod
+    def digest(url:str) -> bytes:
+        return hashlib.blake2b(url.encode('utf-8'), digest_size=16).digest()
+
+    def add(self, url:str) -> bool:
+        """
+        add url, return False if it was already seen
+        """
+        digest = self.digest(url)
+        if self._bloom is not None:
+            if digest in self._bloom:
+                return False
+            self._bloom.add(digest)
+        else:
+            if digest in self._exact:
+                return False
+            self._exact.add(digest)
+            if len(self._exact) > self.exact_limit:
+                self._to_bloom()
+        self._count += 1
+        return True
+
+    def __contains__(self, url:str) -> bool:
+        digest = self.digest(url)
+        return digest in (self._bloom if self._bloom is not None else self._exact)
+
+    def __len__(self) -> int:
+        return self._count
+
+    def _to_bloom(self) -> None:
+        self._bloom = BloomFilter(max(self.capacity, len(self._exact) * 2), self.error_rate)
+        for digest in self._exact:
+            self._bloom.add(digest)
+        self._exact = set()
+
+
+# ----------------------------------------------------------------------------
+# Frontier
+class Frontier:
+    """
+    priority url frontier with per host politeness
+
+    every host has its own priority queue (lower priority value first), a host
+    serves one url at a time and waits `delay` seconds between two urls
+    """
+
+    def __init__(self, delay:float=1.0) -> None:
+        self.delay = delay
+        # host -> heap of (priority, seq, url, depth)
+        self._queues = {}
+        # heap of (ready_at, host) for idle hosts with queued urls
+        self._ready = []
+        # hosts in _ready or busy
+        self._scheduled = set()
+        # host -> entry being fetched
+        self._in_flight = {}
+        self._next_time = {}
+        self._seq = itertools.count()
+        self._size = 0
+
+    def __len__(self) -> int:
+        return self._size
+
+    def push(self, url:str, priority:float=0, depth:int=0) -> None:
+        host = urlsplit(url).netloc
+        heapq.heappush(self._queues.setdefault(host, []), (priority, next(self._seq), url, depth))
+        self._size += 1
+        if host not in self._scheduled:
+            self._schedule(host)
+
+    def pop(self) -> Optional[tuple[str, int, str]]:
+        """
+        (url, depth, host) of a host allowed to be fetched now, or None
+        call done(host) when the fetch finished
+        """
+        if not self._ready or self._ready[0][0] > time.monotonic():
+            return None
+        _, host = heapq.heappop(self._ready)
+        entry = heapq.heappop(self._queues[host])
+        if not self._queues[host]:
+            del self._queues[host]
+        self._size -= 1
+        self._in_flight[host] = entry
+        return entry[2], entry[3], host
+
+    def done(self, host:str) -> None:
+        self._in_flight.pop(host, None)
+        self._next_time[host] = time.monotonic() + self.delay
+        self._scheduled.discard(host)
+        if host in self._queues:
+            self._schedule(host)
+        elif len(self._next_time) > 10_000:
+            # forget finished hosts, their delay has passed
+            now = time.monotonic()
+            self._next_time = {h: t for h, t in self._next_time.items() if t > now}
+
+    def next_ready_in(self) -> Optional[float]:
+        """
+        seconds until the next host is ready, None if nothing is queued
+        """
+        if not self._ready:
+            return None
+        return max(0.0, self._ready[0][0] - time.monotonic())
+
+    def _schedule(self, host:str) -> None:
+        self._scheduled.add(host)
+        heapq.heappush(self._ready, (max(time.monotonic(), self._next_time.get(host, 0)), host))
+
+    def state(self) -> list[tuple]:
+        """
+        queued and in-flight entries, for checkpoints
+        """
+        entries = [entry for queue in self._queues.values() for entry in queue]
+        return entries + list(self._in_flight.values())
+
+
+# ----------------------------------------------------------------------------
+# Crawler
+class Crawler:
+    """
+    async crawler on top of AsyncSessionManager
+
+    usage)
+    async with AsyncSessionManager(max_connections=50) as session:
+        crawler = Crawler(session, workers=20, delay=1.0, max_depth=3)
+        async for result in crawler.run(['https://example.com/']):
+            if result.ok: ...
+
+    extract_links(response) -> urls to follow (default: <a href>)
+    priority(url, depth) -> lower first (default: depth, breadth first)
+    allowed_hosts: follow only these hosts, None -> hosts of the seeds
+    checkpoint_path: frontier, seen set, allowed_hosts and max_depth are saved every
+                     `checkpoint_every` pages and on exit, and loaded again by the next
+                     Crawler with the same path
+    """
+
+    def __init__(self, 
+                 session:AsyncSessionManager, 
+                 extract_links:Callable=extract_links, 
+                 workers:int=10, 
+                 delay:float=1.0, 
+                 max_depth:int=None, 
+                 max_pages:int=None, 
+                 allowed_hosts:Iterable[str]=None, 
+                 priority:Callable[[str, int], float]=None, 
+                 seen:SeenSet=None, 
+                 checkpoint_path:str=None, 
+                 checkpoint_every:int=1000
+                 ) -> None:
+        self.session = session
+        self.extract_links = extract_links
+        self.workers = workers
+        self.max_depth = max_depth
+        self.max_pages = max_pages
+        self.allowed_hosts = set(allowed_hosts) if allowed_hosts else None
+        self.priority = priority or (lambda url, depth: depth)
+        self.checkpoint_path = checkpoint_path
+        self.checkpoint_every = checkpoint_every
+
+        self.frontier = Frontier(delay)
+        self.seen = seen or SeenSet()
+        self.pages = 0
+        self._active = 0
+
+        if checkpoint_path and os.path.exists(checkpoint_path):
+            self.load_checkpoint()
+
+    def add(self, url:str, depth:int=0, base:str=None) -> bool:
+        """
+        queue url if it is new and allowed
+        """
+        url = normalize_url(url, base)
+        if url is None:
+            return False
+        if self.max_depth is not None and depth > self.max_depth:
+            return False
+        if self.allowed_hosts is not None and urlsplit(url).hostname not in self.allowed_hosts:
+            return False
+        if not self.seen.add(url):
+            return False
+        self.frontier.push(url, self.priority(url, depth), depth)
+        return True
+
+    async def run(self, seeds:Iterable[str]=()) -> AsyncIterator[BatchResult]:
+        """
+        crawl until the frontier is empty (or max_pages), yield BatchResult per page
+        """
+        seeds = list(seeds)
+        if self.allowed_hosts is None and seeds:
+            self.allowed_hosts = {urlsplit(url).hostname for url in seeds}
+        for url in seeds:
+            self.add(url)
+
+        results = asyncio.Queue(maxsize=self.workers * 2)
+        tasks = [asyncio.ensure_future(self._worker(results)) for _ in range(self.workers)]
+        closer = asyncio.ensure_future(self._close_when_done(tasks, results))
+        try:
+            while True:
+                result = await results.get()
+                if result is None:
+                    # re-raises what stopped a worker (e.g. a failed checkpoint save)
+                    await closer
+                    break
+                yield result
+        finally:
+            for task in tasks + [closer]:
+                task.cancel()
+            if self.checkpoint_path:
+                self.save_checkpoint()
+
+    async def _close_when_done(self, tasks:list, results:asyncio.Queue) -> None:
+        try:
+            await asyncio.gather(*tasks)
+        except asyncio.CancelledError:
+            # run() stopped reading
+            raise
+        except BaseException:
+            # a worker failed, wake run() so it doesn't wait for results that never come
+            await results.put(None)
+            raise
+        await results.put(None)
+
+    async def _worker(self, results:asyncio.Queue) -> None:
+        while True:
+            if self.max_pages is not None and self.pages >= self.max_pages:
+                return
+            item = self.frontier.pop()
+            if item is None:
+                if not len(self.frontier) and not self._active:
+                    return
+                wait = self.frontier.next_ready_in()
+                await asyncio.sleep(min(wait, 1.0) if wait is not None else 0.05)
+                continue
+
+            url, depth, host = item
+            self._active += 1
+            self.pages += 1
+            index = self.pages
+            try:
+                try:
+                    r = await self.session.get(url, follow_redirects=True)
+                    for link in self.extract_links(r):
+                        self.add(link, depth + 1, url)
+                    result = BatchResult(index, {'url': url, 'depth': depth}, response=r)
+                except Exception as e:
+                    result = BatchResult(index, {'url': url, 'depth': depth}, error=e)
+            finally:
+                self.frontier.done(host)
+                self._active -= 1
+
+            await results.put(result)
+            if self.checkpoint_path and index % self.checkpoint_every == 0:
+                self.save_checkpoint()
+
+    # ------------------------------------------------------------------------
+    # Checkpoint
+    def save_checkpoint(self) -> None:
+        state = {'entries': self.frontier.state(), 'seen': self.seen, 'pages': self.pages, 
+                 'allowed_hosts': self.allowed_hosts, 'max_depth': self.max_depth}
+        tmp_path = f'{self.checkpoint_path}.tmp'
+        with open(tmp_path, 'wb') as f:
+            pickle.dump(state, f, protocol=pickle.HIGHEST_PROTOCOL)
+        os.replace(tmp_path, self.checkpoint_path)
+
+    def load_checkpoint(self) -> None:
+        with open(self.checkpoint_path, 'rb') as f:
+            state = pickle.load(f)
+        self.seen = state['seen']
+        self.pages = state['pages']
+        # a resumed crawl keeps its scope, arguments given to this Crawler win
+        if self.allowed_hosts is None:
+            self.allowed_hosts = state.get('allowed_hosts')
+        if self.max_depth is None:
+            self.max_depth = state.get('max_depth')
+        for priority, _, url, depth in state['entries']:
+            self.frontier.push(url, priority, depth)
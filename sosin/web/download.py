@@ -0,0 +1,300 @@
+import asyncio
+import os
+
+from concurrent.futures import ThreadPoolExecutor
+
+import requests
+import httpx
+
+CHUNK_SIZE = 1 << 16
+
+# byte offsets must match the file on disk, so ask for the raw body
+IDENTITY = {'Accept-Encoding': 'identity'}
+
+# bodies are written next to file_path and moved in place once complete
+PART_SUFFIX = '.part'
+META_SUFFIX = '.meta'
+
+
+def split_ranges(size:int, parts:int) -> list[tuple[int, int]]:
+    """
+    split [0, size) into `parts` inclusive byte ranges
+    """
+    step = -(-size // parts)
+    return [(start, min(start + step, size) - 1) for start in range(0, size, step)]
+
+
+def _probe(r) -> tuple[int, bool]:
+    """
+    HEAD response -> (content length, range support)
+    """
+    size = int(r.headers.get('content-length') or 0)
+    ranged = r.headers.get('accept-ranges', '').lower() == 'bytes'
+    return size, ranged
+
+
+def _validator(headers) -> str:
+    """
+    strong ETag or Last-Modified, what If-Range accepts
+    """
+    etag = headers.get('etag')
+    if etag and not etag.startswith('W/'):
+        return etag
+    return headers.get('last-modified')
+
+
+def _resume_state(file_path:str, resume:bool) -> tuple[int, str]:
+    """
+    (offset, validator) of an interrupted download
+    a partial without a recorded validator can't be checked against the remote, so it starts over
+    """
+    part = file_path + PART_SUFFIX
+    if resume and os.path.exists(part) and os.path.exists(part + META_SUFFIX):
+        with open(part + META_SUFFIX, encoding='UTF-8') as f:
+            validator = f.read().strip()
+        if validator:
+            return os.path.getsize(part), validator
+    return 0, None
+
+
+def _stream_headers(headers:dict, offset:int, validator:str) -> dict:
+    headers = {**headers, **IDENTITY}
+    if offset:
+        # a changed remote answers 200 with the full body instead of the rest of a stale one
+        headers['Range'] = f'bytes={offset}-'
+        headers['If-Range'] = validator
+    return headers
+
+
+def _complete(r, offset:int) -> bool:
+    """
+    416 on resume: the partial already holds the whole body (Content-Range: bytes */size)
+    """
+    total = r.headers.get('content-range', '').rpartition('/')[2]
+    return total.isdigit() and int(total) == offset
+
+
+def _begin(file_path:str, r, offset:int) -> str:
+    """
+    record the validator of r next to the partial, returns the file mode for its body
+    """
+    meta = file_path + PART_SUFFIX + META_SUFFIX
+    validator = _validator(r.headers)
+    if validator:
+        with open(meta, 'w', encoding='UTF-8') as f:
+            f.write(validator)
+    elif os.path.exists(meta):
+        os.remove(meta)
+    return 'ab' if offset and r.status_code == 206 else 'wb'
+
+
+def _finish(file_path:str) -> str:
+    os.replace(file_path + PART_SUFFIX, file_path)
+    meta = file_path + PART_SUFFIX + META_SUFFIX
+    if os.path.exists(meta):
+        os.remove(meta)
+    return file_path
+
+
+def _abandon(file_path:str) -> None:
+    """
+    drop a partial that can't be resumed (range downloads leave holes)
+    """
+    for path in (file_path + PART_SUFFIX, file_path + PART_SUFFIX + META_SUFFIX):
+        if os.path.exists(path):
+            os.remove(path)
+
+
+def _range_headers(headers:dict, head) -> dict:
+    """
+    pin every part to the version HEAD saw, a changed remote then fails the part instead of mixing versions
+    """
+    validator = _validator(head.headers)
+    return {**headers, 'If-Range': validator} if validator else headers
+
+
+def _preallocate(file_path:str, size:int) -> None:
+    with open(file_path, 'wb') as f:
+        f.truncate(size)
+
+
+# ----------------------------------------------------------------------------
+# requests
+def stream_download(session:requests.Session, 
+                    url:str, 
+                    file_path:str, 
+                    chunk_size:int=CHUNK_SIZE, 
+                    resume:bool=True, 
+                    headers:dict={}, 
+                    **kwargs
+                    ) -> str:
+    """
+    write the body to file_path chunk by chunk, through file_path.part
+    resume: continue an interrupted download with a Range / If-Range request
+    """
+    offset, validator = _resume_state(file_path, resume)
+    with session.get(url, headers=_stream_headers(headers, offset, validator), stream=True, **kwargs) as r:
+        if offset and r.status_code == 416:
+            if _complete(r, offset):
+                return _finish(file_path)
+            # partial longer than the remote body
+            restart = True
+        else:
+            restart = False
+            r.raise_for_status()
+            mode = _begin(file_path, r, offset)
+            with open(file_path + PART_SUFFIX, mode) as f:
+                for chunk in r.iter_content(chunk_size):
+                    f.write(chunk)
+    if restart:
+        _abandon(file_path)
+        return stream_download(session, url, file_path, chunk_size, False, headers, **kwargs)
+    return _finish(file_path)
+
+
+def _fetch_range(session:requests.Session, 
+                 url:str, 
+                 file_path:str, 
+                 start:int, 
+                 end:int, 
+                 chunk_size:int, 
+                 headers:dict, 
+                 kwargs:dict
+                 ) -> None:
+    headers = {**headers, **IDENTITY, 'Range': f'bytes={start}-{end}'}
+    with session.get(url, headers=headers, stream=True, **kwargs) as r:
+        r.raise_for_status()
+        if r.status_code != 206:
+            raise requests.HTTPError(f'range request ignored: {r.status_code}', response=r)
+        with open(file_path, 'r+b') as f:
+            f.seek(start)
+            for chunk in r.iter_content(chunk_size):
+                f.write(chunk)
+
+
+def download(session:requests.Session, 
+             url:str, 
+             file_path:str, 
+             parts:int=1, 
+             chunk_size:int=CHUNK_SIZE, 
+             resume:bool=True, 
+             headers:dict={}, 
+             **kwargs
+             ) -> str:
+    """
+    streaming download
+    session: requests.Session or SessionManager (anything with get / head)
+    parts > 1: fetch byte ranges concurrently when the server advertises Accept-Ranges
+    """
+    if parts > 1:
+        r = session.head(url, headers={**headers, **IDENTITY}, allow_redirects=True, **kwargs)
+        size, ranged = _probe(r)
+        if ranged and size:
+            range_headers = _range_headers(headers, r)
+            part = file_path + PART_SUFFIX
+            _abandon(file_path)
+            _preallocate(part, size)
+            try:
+                with ThreadPoolExecutor(max_workers=parts) as executor:
+                    futures = [executor.submit(_fetch_range, session, url, part, 
+                                               start, end, chunk_size, range_headers, kwargs)
+                               for start, end in split_ranges(size, parts)]
+                    for future in futures:
+                        future.result()
+            except BaseException:
+                _abandon(file_path)
+                raise
+            return _finish(file_path)
+
+    return stream_download(session, url, file_path, chunk_size, resume, headers, **kwargs)
+
+
+# ----------------------------------------------------------------------------
+# httpx
+async def astream_download(client:httpx.AsyncClient, 
+                           url:str, 
+                           file_path:str, 
+                           chunk_size:int=CHUNK_SIZE, 
+                           resume:bool=True, 
+                           headers:dict={}, 
+                           **kwargs
+                           ) -> str:
+    """
+    async version of stream_download
+    """
+    offset, validator = _resume_state(file_path, resume)
+    async with client.stream('GET', url, headers=_stream_headers(headers, offset, validator), **kwargs) as r:
+        if offset and r.status_code == 416:
+            if _complete(r, offset):
+                return _finish(file_path)
+            restart = True
+        else:
+            restart = False
+            r.raise_for_status()
+            mode = _begin(file_path, r, offset)
+            with open(file_path + PART_SUFFIX, mode) as f:
+                async for chunk in r.aiter_bytes(chunk_size):
+                    f.write(chunk)
+    if restart:
+        _abandon(file_path)
+        return await astream_download(client, url, file_path, chunk_size, False, headers, **kwargs)
+    return _finish(file_path)
+
+
+async def _afetch_range(client:httpx.AsyncClient, 
+                        url:str, 
+                        file_path:str, 
+                        start:int, 
+                        end:int, 
+                        chunk_size:int, 
+                        headers:dict, 
+                        kwargs:dict
+                        ) -> None:
+    headers = {**headers, **IDENTITY, 'Range': f'bytes={start}-{end}'}
+    async with client.stream('GET', url, headers=headers, **kwargs) as r:
+        r.raise_for_status()
+        if r.status_code != 206:
+            raise httpx.HTTPStatusError(f'range request ignored: {r.status_code}', 
+                                        request=r.request, response=r)
+        with open(file_path, 'r+b') as f:
+            f.seek(start)
+            async for chunk in r.aiter_bytes(chunk_size):
+                f.write(chunk)
+
+
+async def adownload(client:httpx.AsyncClient, 
+                    url:str, 
+                    file_path:str, 
+                    parts:int=1, 
+                    chunk_size:int=CHUNK_SIZE, 
+                    resume:bool=True, 
+                    headers:dict={}, 
+                    **kwargs
+                    ) -> str:
+    """
+    async version of download
+    client: httpx.AsyncClient or AsyncSessionManager (anything with stream / head)
+    """
+    if parts > 1:
+        r = await client.head(url, headers={**headers, **IDENTITY}, follow_redirects=True, **kwargs)
+        size, ranged = _probe(r)
+        if ranged and size:
+            range_headers = _range_headers(headers, r)
+            part = file_path + PART_SUFFIX
+            _abandon(file_path)
+            _preallocate(part, size)
+            tasks = [asyncio.ensure_future(_afetch_range(client, url, part, 
+                                                         start, end, chunk_size, range_headers, kwargs))
+                     for start, end in split_ranges(size, parts)]
+            try:
+                await asyncio.gather(*tasks)
+            except BaseException:
+                # stop the other parts before their file goes away
+                for task in tasks:
+                    task.cancel()
+                await asyncio.gather(*tasks, return_exceptions=True)
+                _abandon(file_path)
+                raise
+            return _finish(file_path)
+
+    return await astream_download(client, url, file_path, chunk_size, resume, headers, **kwargs)
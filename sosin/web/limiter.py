@@ -0,0 +1,195 @@
+import asyncio
+import threading
+import time
+
+
+class TokenBucket:
+    """
+    token bucket refilled at `rate` tokens/sec up to `capacity`
+    """
+
+    __slots__ = ('rate', 'capacity', 'tokens', 'updated')
+
+    def __init__(self, rate:float, capacity:int=1) -> None:
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = float(capacity)
+        self.updated = time.monotonic()
+
+    def reserve(self) -> float:
+        """
+        take a token, return seconds to wait before using it
+        tokens may go negative so concurrent callers are queued in order
+        """
+        now = time.monotonic()
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+        self.tokens -= 1
+        return 0.0 if self.tokens >= 0 else -self.tokens / self.rate
+
+
+class RateLimiter:
+    """
+    per host token bucket rate limiter
+    rate: requests per second, burst: requests allowed at once
+    host_rates = {'api.example.com': 10, 'slow.example.com': (0.5, 1)}  -> rate or (rate, burst)
+
+    a host waiting for tokens never blocks requests to other hosts
+    """
+
+    def __init__(self, rate:float=1.0, burst:int=1, host_rates:dict={}) -> None:
+        self.rate = rate
+        self.burst = burst
+        self.host_rates = host_rates
+        self._buckets = {}
+        self._lock = threading.Lock()
+
+    def reserve(self, host:str) -> float:
+        with self._lock:
+            bucket = self._buckets.get(host)
+            if bucket is None:
+                bucket = self._buckets[host] = self._new_bucket(host)
+            return bucket.reserve()
+
+    def wait(self, host:str) -> None:
+        delay = self.reserve(host)
+        if delay:
+            time.sleep(delay)
+
+    async def wait_async(self, host:str) -> None:
+        delay = self.reserve(host)
+        if delay:
+            await asyncio.sleep(delay)
+
+    def _new_bucket(self, host:str) -> TokenBucket:
+        rate = self.host_rates.get(host, (self.rate, self.burst))
+        if isinstance(rate, (int, float)):
+            rate = (rate, self.burst)
+        return TokenBucket(*rate)
+
+
+class _HostWindow:
+
+    __slots__ = ('limit', 'in_flight', 'latency', 'decreased_at', 'waiters')
+
+    def __init__(self, limit:float) -> None:
+        self.limit = limit
+        self.in_flight = 0
+        self.latency = None
+        self.decreased_at = 0.0
+        self.waiters = []
+
+
+class AdaptiveConcurrency:
+    """
+    per host concurrency limit tuned by AIMD
+
+    the limit grows by `increase` per window of successful responses and is
+    multiplied by `decrease` on a throttling status (429, 503), a transport error
+    or a latency above `latency_factor` x the host's average latency
+    at most one decrease per round trip, so a burst of 429s counts once
+    """
+
+    def __init__(self, 
+                 initial:int=4, 
+                 minimum:int=1, 
+                 maximum:int=64, 
+                 increase:float=1.0, 
+                 decrease:float=0.5, 
+                 latency_factor:float=2.0, 
+                 statuses:tuple=(429, 503)
+                 ) -> None:
+        self.initial = initial
+        self.minimum = minimum
+        self.maximum = maximum
+        self.increase = increase
+        self.decrease = decrease
+        self.latency_factor = latency_factor
+        self.statuses = statuses
+        self._hosts = {}
+        self._lock = threading.Lock()
+        self._cond = threading.Condition(self._lock)
+
+    def limit(self, host:str) -> int:
+        with self._lock:
+            return int(self._window(host).limit)
+
+    def limits(self) -> dict:
+        with self._lock:
+            return {host: int(w.limit) for host, w in self._hosts.items()}
+
+    # ------------------------------------------------------------------------
+    # Slots
+    def acquire(self, host:str) -> None:
+        with self._cond:
+            window = self._window(host)
+            while window.in_flight >= int(window.limit):
+                self._cond.wait()
+            window.in_flight += 1
+
+    async def acquire_async(self, host:str) -> None:
+        with self._lock:
+            window = self._window(host)
+            if window.in_flight < int(window.limit):
+                window.in_flight += 1
+                return
+            # [future, granted]
+            waiter = [asyncio.get_running_loop().create_future(), False]
+            window.waiters.append(waiter)
+
+        try:
+            await waiter[0]
+        except asyncio.CancelledError:
+            with self._lock:
+                if waiter[1]:
+                    # slot was handed over right before cancel
+                    window.in_flight -= 1
+                    self._wake(window)
+                elif waiter in window.waiters:
+                    window.waiters.remove(waiter)
+            raise
+
+    def release(self, host:str, status:int=None, latency:float=None, error:bool=False) -> None:
+        with self._cond:
+            window = self._window(host)
+            window.in_flight -= 1
+
+            now = time.monotonic()
+            slow = latency is not None and window.latency is not None \
+                and latency > window.latency * self.latency_factor
+            if error or status in self.statuses or slow:
+                if now - window.decreased_at > (window.latency or 0):
+                    window.limit = max(self.minimum, window.limit * self.decrease)
+                    window.decreased_at = now
+            else:
+                window.limit = min(self.maximum, window.limit + self.increase / window.limit)
+
+            if latency is not None and not error:
+                window.latency = latency if window.latency is None \
+                    else window.latency * 0.9 + latency * 0.1
+
+            self._wake(window)
+            self._cond.notify_all()
+
+    def _window(self, host:str) -> _HostWindow:
+        window = self._hosts.get(host)
+        if window is None:
+            window = self._hosts[host] = _HostWindow(float(self.initial))
+        return window
+
+    @staticmethod
+    def _wake(window:_HostWindow) -> None:
+        # called with the lock held, hand free slots to async waiters
+        while window.waiters and window.in_flight < int(window.limit):
+            waiter = window.waiters.pop(0)
+            future = waiter[0]
+            if future.done():
+                continue
+            waiter[1] = True
+            window.in_flight += 1
+            future.get_loop().call_soon_threadsafe(_set_ready, future)
+
+
+def _set_ready(future:asyncio.Future) -> None:
+    if not future.done():
+        future.set_result(None)
@@ -0,0 +1,191 @@
+import bisect
+import threading
+import time
+
+# seconds
+BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+
+PHASES = ('connect', 'tls', 'send', 'wait', 'receive', 'total')
+
+
+class LatencyHistogram:
+    """
+    fixed bucket histogram, quantiles are interpolated inside a bucket
+    """
+
+    __slots__ = ('buckets', 'counts', 'count', 'sum')
+
+    def __init__(self, buckets:tuple=BUCKETS) -> None:
+        self.buckets = buckets
+        # last slot is +Inf
+        self.counts = [0] * (len(buckets) + 1)
+        self.count = 0
+        self.sum = 0.0
+
+    def observe(self, seconds:float) -> None:
+        self.counts[bisect.bisect_left(self.buckets, seconds)] += 1
+        self.count += 1
+        self.sum += seconds
+
+    def quantile(self, q:float) -> float:
+        if not self.count:
+            return 0.0
+        rank = q * self.count
+        seen = 0
+        for i, n in enumerate(self.counts):
+            if seen + n >= rank and n:
+                if i == len(self.buckets):
+                    return self.buckets[-1]
+                lower = self.buckets[i-1] if i else 0.0
+                return lower + (self.buckets[i] - lower) * (rank - seen) / n
+            seen += n
+        return self.buckets[-1]
+
+
+class _HttpxTrace:
+    """
+    httpx `trace` extension callback, keeps the time of every httpcore event
+    """
+
+    __slots__ = ('events',)
+
+    def __init__(self) -> None:
+        self.events = {}
+
+    async def __call__(self, event_name:str, info:dict) -> None:
+        # http11.send_request_headers.started -> send_request_headers.started
+        self.events.setdefault(event_name.split('.', 1)[1], time.perf_counter())
+
+    def span(self, name:str, end:str=None):
+        start = self.events.get(f'{name}.started')
+        stop = self.events.get(f'{end or name}.complete')
+        if start is None or stop is None:
+            return None
+        return stop - start
+
+    def phases(self) -> dict:
+        send = self.span('send_request_headers', 'send_request_body')
+        return {
+            # httpcore resolves the host inside connect_tcp, so connect includes DNS
+            'connect': self.span('connect_tcp'),
+            'tls': self.span('start_tls'),
+            'send': send if send is not None else self.span('send_request_headers'),
+            'wait': self.span('receive_response_headers'),
+            'receive': self.span('receive_response_body'),
+        }
+
+
+class RequestMetrics:
+    """
+    per host latency histograms and byte counters
+
+    phases
+        connect: DNS + TCP connect (new connections only)
+        tls: TLS handshake (new connections only)
+        send: writing the request
+        wait: server time until response headers
+        receive: reading the body
+        total: whole request
+
+    httpx requests report every phase through the trace extension,
+    requests only exposes wait (time to headers, including connect) / receive / total
+    """
+
+    def __init__(self, buckets:tuple=BUCKETS) -> None:
+        self.buckets = buckets
+        self._histograms = {}
+        self._bytes = {}
+        self._lock = threading.Lock()
+
+    def observe(self, host:str, phase:str, seconds:float) -> None:
+        with self._lock:
+            histogram = self._histograms.get((host, phase))
+            if histogram is None:
+                histogram = self._histograms[(host, phase)] = LatencyHistogram(self.buckets)
+            histogram.observe(seconds)
+
+    def add_bytes(self, host:str, sent:int, received:int) -> None:
+        with self._lock:
+            counter = self._bytes.setdefault(host, [0, 0])
+            counter[0] += sent
+            counter[1] += received
+
+    def trace(self) -> _HttpxTrace:
+        return _HttpxTrace()
+
+    # ------------------------------------------------------------------------
+    # Recording
+    def record_httpx(self, host:str, r, trace:_HttpxTrace, total:float) -> None:
+        for phase, seconds in trace.phases().items():
+            if seconds is not None:
+                self.observe(host, phase, seconds)
+        self.observe(host, 'total', total)
+        try:
+            sent = len(r.request.content)
+        except Exception:
+            sent = int(r.request.headers.get('content-length') or 0)
+        self.add_bytes(host, sent, r.num_bytes_downloaded)
+
+    def record_requests(self, host:str, r, total:float) -> None:
+        wait = r.elapsed.total_seconds()
+        self.observe(host, 'wait', wait)
+        self.observe(host, 'receive', max(total - wait, 0.0))
+        self.observe(host, 'total', total)
+
+        body = r.request.body
+        sent = len(body) if isinstance(body, (bytes, str)) else int(r.request.headers.get('content-length') or 0)
+        try:
+            # bytes read from the socket, before decompression
+            received = r.raw.tell()
+        except Exception:
+            received = len(r.content)
+        self.add_bytes(host, sent, received)
+
+    # ------------------------------------------------------------------------
+    # Reading
+    def quantiles(self, host:str, phase:str='total', qs:tuple=(0.5, 0.95, 0.99)) -> dict:
+        with self._lock:
+            histogram = self._histograms.get((host, phase))
+            if histogram is None:
+                return {}
+            return {f'p{int(q * 100)}': histogram.quantile(q) for q in qs}
+
+    def summary(self) -> dict:
+        """
+        {host: {phase: {'p50', 'p95', 'p99', 'count'}, 'bytes_sent', 'bytes_received'}}
+        """
+        result = {}
+        with self._lock:
+            for (host, phase), histogram in self._histograms.items():
+                result.setdefault(host, {})[phase] = {
+                    'p50': histogram.quantile(0.5), 
+                    'p95': histogram.quantile(0.95), 
+                    'p99': histogram.quantile(0.99), 
+                    'count': histogram.count, 
+                }
+            for host, (sent, received) in self._bytes.items():
+                result.setdefault(host, {}).update(bytes_sent=sent, bytes_received=received)
+        return result
+
+    def to_prometheus(self, prefix:str='sosin_http') -> str:
+        """
+        Prometheus text exposition format
+        """
+        lines = [f'# TYPE {prefix}_request_duration_seconds histogram']
+        with self._lock:
+            for (host, phase), histogram in sorted(self._histograms.items()):
+                labels = f'host="{host}",phase="{phase}"'
+                cumulative = 0
+                for le, n in zip(histogram.buckets + ('+Inf',), histogram.counts):
+                    cumulative += n
+                    lines.append(f'{prefix}_request_duration_seconds_bucket{{{labels},le="{le}"}} {cumulative}')
+                lines.append(f'{prefix}_request_duration_seconds_sum{{{labels}}} {histogram.sum}')
+                lines.append(f'{prefix}_request_duration_seconds_count{{{labels}}} {histogram.count}')
+
+            lines.append(f'# TYPE {prefix}_sent_bytes_total counter')
+            for host, (sent, _) in sorted(self._bytes.items()):
+                lines.append(f'{prefix}_sent_bytes_total{{host="{host}"}} {sent}')
+            lines.append(f'# TYPE {prefix}_received_bytes_total counter')
+            for host, (_, received) in sorted(self._bytes.items()):
+                lines.append(f'{prefix}_received_bytes_total{{host="{host}"}} {received}')
+        return '\n'.join(lines) + '\n'
@@ -0,0 +1,122 @@
+import asyncio
+import mimetypes
+import os
+import random
+import string
+
+from typing import AsyncIterator, Callable
+
+CHUNK_SIZE = 1 << 16
+
+MIME_TYPES = {
+    'jpg': 'image/jpeg',
+    'jpeg': 'image/jpeg',
+    'png': 'image/png',
+    'xlsx': 'application/vnd.openxmlformats-officedocument.spreadsheetml.sheet',
+    'xls': 'application/vnd.ms-excel',
+    'zip': 'application/x-zip-compressed',
+}
+
+
+def guess_mime_type(file_name:str) -> str:
+    ext = file_name.split('.').pop().lower()
+    if ext in MIME_TYPES:
+        return MIME_TYPES[ext]
+    return mimetypes.guess_type(file_name)[0] or 'application/octet-stream'
+
+
+def make_boundary() -> str:
+    return '----WebKitFormBoundary' +\
+        ''.join(random.sample(string.ascii_letters + string.digits, 16))
+
+
+class AsyncMultipartStream:
+    """
+    multipart/form-data body streamed from disk for httpx.AsyncClient(content=...)
+
+    fields = {name: value}
+    files = {name: file_path}
+    progress(sent_bytes, total_bytes) is called after every chunk
+
+    files are opened only while their part is sent, read in chunks on the default
+    executor so the event loop never blocks, and closed right after
+    iterating again (e.g. on retry) sends the whole body again
+    """
+
+    def __init__(self, 
+                 fields:dict={}, 
+                 files:dict={}, 
+                 boundary:str=None, 
+                 chunk_size:int=CHUNK_SIZE, 
+                 progress:Callable[[int, int], None]=None
+                 ) -> None:
+        self.boundary = boundary or make_boundary()
+        self.chunk_size = chunk_size
+        self.progress = progress
+
+        self._parts = []
+        for name, value in fields.items():
+            if not isinstance(value, bytes):
+                value = str(value).encode('utf-8')
+            self._parts.append((self._part_header(name), value))
+        for name, file_path in files.items():
+            file_name = os.path.basename(file_path)
+            self._parts.append((self._part_header(name, file_name, guess_mime_type(file_name)), file_path))
+        self._closing = f'--{self.boundary}--\r\n'.encode()
+
+    @property
+    def content_type(self) -> str:
+        return f'multipart/form-data; boundary={self.boundary}'
+
+    @property
+    def content_length(self) -> int:
+        length = len(self._closing)
+        for header, body in self._parts:
+            size = len(body) if isinstance(body, bytes) else os.path.getsize(body)
+            length += len(header) + size + 2
+        return length
+
+    async def __aiter__(self) -> AsyncIterator[bytes]:
+        loop = asyncio.get_running_loop()
+        total = self.content_length
+        sent = 0
+        for header, body in self._parts:
+            yield header
+            sent += len(header)
+            if isinstance(body, bytes):
+                yield body
+                sent += len(body)
+            else:
+                f = await loop.run_in_executor(None, open, body, 'rb')
+                try:
+                    while True:
+                        chunk = await loop.run_in_executor(None, f.read, self.chunk_size)
+                        if not chunk:
+                            break
+                        yield chunk
+                        sent += len(chunk)
+                        self._report(sent, total)
+                finally:
+                    f.close()
+            yield b'\r\n'
+            sent += 2
+            self._report(sent, total)
+        yield self._closing
+        self._report(total, total)
+
+    def _report(self, sent:int, total:int) -> None:
+        if self.progress is not None:
+            self.progress(sent, total)
+
+    def _part_header(self, name:str, file_name:str=None, mime_type:str=None) -> bytes:
+        disposition = f'form-data; name="{self._quote(name)}"'
+        if file_name is not None:
+            disposition += f'; filename="{self._quote(file_name)}"'
+        header = f'--{self.boundary}\r\nContent-Disposition: {disposition}\r\n'
+        if mime_type:
+            header += f'Content-Type: {mime_type}\r\n'
+        return (header + '\r\n').encode('utf-8')
+
+    @staticmethod
+    def _quote(value:str) -> str:
+        return str(value).replace('"', '%22').replace('\r', '%0D').replace('\n', '%0A')
@@ -0,0 +1,28 @@
+from typing import Callable, Optional, Union
+from urllib.parse import urljoin
+
+def page_request(url:str, params:dict, page_param:str, page:int) -> dict:
+    """
+    request of page N for `?page=N` style endpoints
+    """
+    return {'url': url, 'params': {**params, page_param: page}}
+
+def follow(url:str, params:dict, link:Union[str, dict, None]) -> Optional[dict]:
+    """
+    request after a page from what next_page(r) returned
+    str: next link (absolute or relative to the current page, carries its own query)
+    dict: params to merge, e.g. {'cursor': 'abc'}
+    None / empty: last page
+    """
+    if not link:
+        return None
+    if isinstance(link, dict):
+        return {'url': url, 'params': {**params, **link}}
+    return {'url': urljoin(url, link), 'params': {}}
+
+def page_items(extract:Callable, r) -> list:
+    """
+    items of a page, an empty page (or None) ends page-number walks
+    """
+    items = extract(r)
+    return [] if items is None else list(items)
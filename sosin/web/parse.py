@@ -0,0 +1,283 @@
+import asyncio
+import codecs
+
+from concurrent.futures import Executor, ProcessPoolExecutor
+from html import escape
+from html.parser import HTMLParser
+from typing import AsyncIterable, AsyncIterator, Callable, Iterable, Iterator, Union
+
+try:
+    from bs4 import BeautifulSoup, SoupStrainer, Tag
+except:
+    print('you need to install BeautifulSoup4\n$ : python -m pip install BeautifulSoup4')
+    BeautifulSoup = SoupStrainer = Tag = None
+try:
+    from lxml import etree
+except:
+    etree = None
+
+VOID_ELEMENTS = {'area', 'base', 'br', 'col', 'embed', 'hr', 'img', 'input',
+                 'link', 'meta', 'param', 'source', 'track', 'wbr'}
+
+_executor = None
+
+def best_parser() -> str:
+    """
+    fastest installed BeautifulSoup tree builder, lxml (C) over html.parser
+    """
+    return 'lxml' if etree is not None else 'html.parser'
+
+class _ClassToken:
+    """
+    class matcher, strainers see the raw `class="a b"` value while parsing
+    """
+
+    def __init__(self, token:str) -> None:
+        self.token = token
+
+    def __call__(self, value) -> bool:
+        if value is None:
+            return False
+        if isinstance(value, str):
+            value = value.split()
+        return self.token in value
+
+def strainer(name:Union[str, list]=None, attrs:dict={}, **kwargs) -> SoupStrainer:
+    """
+    target subtrees to build, everything else is skipped while parsing
+    strainer('table', {'class': 'price'}) / strainer(id='content')
+    """
+    attrs = dict(attrs)
+    if 'class_' in kwargs:
+        attrs['class'] = kwargs.pop('class_')
+    if isinstance(attrs.get('class'), str) and ' ' not in attrs['class']:
+        attrs['class'] = _ClassToken(attrs['class'])
+    return SoupStrainer(name, attrs, **kwargs)
+
+def parse(markup:Union[str, bytes], parse_only:SoupStrainer=None, parser:str=None) -> BeautifulSoup:
+    return BeautifulSoup(markup, parser or best_parser(), parse_only=parse_only)
+
+class Select:
+    """
+    picklable extractor for the process pool
+    selector: css selector
+    attr: attribute to read instead of text
+    one: first match only (None when nothing matched)
+    """
+
+    def __init__(self, selector:str, attr:str=None, one:bool=False) -> None:
+        self.selector = selector
+        self.attr = attr
+        self.one = one
+
+    def _value(self, tag):
+        return tag.get(self.attr) if self.attr else tag.get_text(' ', strip=True)
+
+    def __call__(self, soup:BeautifulSoup):
+        if self.one:
+            tag = soup.select_one(self.selector)
+            return None if tag is None else self._value(tag)
+        return [self._value(tag) for tag in soup.select(self.selector)]
+
+def _parse_extract(markup:Union[str, bytes],
+                   extract:Callable,
+                   parse_only:SoupStrainer,
+                   parser:str):
+    return extract(parse(markup, parse_only, parser))
+
+def get_executor(workers:int=None) -> Executor:
+    """
+    shared process pool for parsing off the event loop
+    """
+    global _executor
+    if _executor is None:
+        _executor = ProcessPoolExecutor(max_workers=workers)
+    return _executor
+
+def shutdown_executor() -> None:
+    global _executor
+    if _executor is not None:
+        _executor.shutdown()
+        _executor = None
+
+async def parse_async(markup:Union[str, bytes],
+                      extract:Callable,
+                      parse_only:SoupStrainer=None,
+                      parser:str=None,
+                      executor:Executor=None):
+    """
+    parse and extract in a worker process, the event loop keeps running
+    extract: module level function or Select, must return picklable data (not Tags)
+    """
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(executor or get_executor(),
+                                      _parse_extract, markup, extract, parse_only, parser)
+
+# ------------------------------------------------------------------------
+# Incremental Parsing
+def _attrs_match(get:Callable, attrs:dict) -> bool:
+    for k, v in attrs.items():
+        value = get(k)
+        if value is None:
+            return False
+        if k == 'class':
+            if v not in value.split():
+                return False
+        elif value != v:
+            return False
+    return True
+
+class _FragmentParser(HTMLParser):
+    """
+    stdlib fallback, collects markup of matching elements while feeding
+    """
+
+    def __init__(self, tag:str, attrs:dict) -> None:
+        super().__init__(convert_charrefs=False)
+        self.tag = tag
+        self.attrs = attrs
+        self.fragments = []
+        self._buffer = None
+        self._depth = 0
+
+    def handle_starttag(self, tag, attrs):
+        if self._buffer is None:
+            if tag != self.tag or not _attrs_match(dict(attrs).get, self.attrs):
+                return
+            self._buffer = []
+        self._buffer.append(self.get_starttag_text())
+        if tag in VOID_ELEMENTS:
+            if self._depth == 0:
+                self._flush()
+            return
+        self._depth += 1
+
+    def handle_startendtag(self, tag, attrs):
+        if self._buffer is None:
+            if tag != self.tag or not _attrs_match(dict(attrs).get, self.attrs):
+                return
+            self._buffer = []
+        self._buffer.append(self.get_starttag_text())
+        if self._depth == 0:
+            self._flush()
+
+    def handle_endtag(self, tag):
+        if self._buffer is None or tag in VOID_ELEMENTS:
+            return
+        self._buffer.append(f'</{tag}>')
+        self._depth -= 1
+        if self._depth == 0:
+            self._flush()
+
+    def handle_data(self, data):
+        if self._buffer is not None:
+            self._buffer.append(data if self.cdata_elem else escape(data, quote=False))
+
+    def handle_entityref(self, name):
+        if self._buffer is not None:
+            self._buffer.append(f'&{name};')
+
+    def handle_charref(self, name):
+        if self._buffer is not None:
+            self._buffer.append(f'&#{name};')
+
+    def _flush(self):
+        self.fragments.append(''.join(self._buffer))
+        self._buffer = None
+        self._depth = 0
+
+class _PullParser:
+    """
+    lxml pull parser, matched elements are serialized then dropped from the tree
+    every finished element outside a match is dropped too, only the open path stays in memory
+    """
+
+    def __init__(self, tag:str, attrs:dict) -> None:
+        self.tag = tag
+        self.attrs = attrs
+        self.fragments = []
+        # all tags, the elements around the matches have to be dropped as well
+        self._parser = etree.HTMLPullParser(events=('end',))
+
+    def feed(self, text:str) -> None:
+        self._parser.feed(text)
+        self._collect()
+
+    def close(self) -> None:
+        self._parser.close()
+        self._collect()
+
+    def _collect(self) -> None:
+        for _, el in self._parser.read_events():
+            # inside an open match, the outer element carries it
+            if any(_attrs_match(a.get, self.attrs) for a in el.iterancestors(self.tag)):
+                continue
+            if el.tag == self.tag and _attrs_match(el.get, self.attrs):
+                self.fragments.append(etree.tostring(el, encoding='unicode', method='html', with_tail=False))
+            el.clear()
+            # finished siblings before el and before each open ancestor
+            node = el
+            while node is not None:
+                while node.getprevious() is not None:
+                    del node.getparent()[0]
+                node = node.getparent()
+
+class StreamParser:
+    """
+    incremental parser for streamed bodies
+    feed chunks as they arrive, matched elements come back as Tags
+    so the whole page never has to be held or parsed at once
+    """
+
+    def __init__(self, tag:str, attrs:dict={}, encoding:str=None, parser:str=None) -> None:
+        self.tag = tag
+        self.parser = parser or best_parser()
+        self._decoder = codecs.getincrementaldecoder(encoding or 'utf-8')(errors='replace')
+        self._impl = _PullParser(tag, attrs) if etree is not None else _FragmentParser(tag, attrs)
+
+    def feed(self, chunk:Union[str, bytes]) -> list[Tag]:
+        if isinstance(chunk, bytes):
+            chunk = self._decoder.decode(chunk)
+        if chunk:
+            self._impl.feed(chunk)
+        return self._drain()
+
+    def close(self) -> list[Tag]:
+        rest = self._decoder.decode(b'', final=True)
+        if rest:
+            self._impl.feed(rest)
+        self._impl.close()
+        return self._drain()
+
+    def _drain(self) -> list[Tag]:
+        fragments, self._impl.fragments = self._impl.fragments, []
+        elements = []
+        for fragment in fragments:
+            # lxml wraps fragments in html/body
+            soup = parse(fragment, parser=self.parser)
+            elements.append(soup.find(self.tag) or soup)
+        return elements
+
+def iter_elements(chunks:Iterable[Union[str, bytes]],
+                  tag:str,
+                  attrs:dict={},
+                  encoding:str=None,
+                  parser:str=None
+                  ) -> Iterator[Tag]:
+    stream = StreamParser(tag, attrs, encoding, parser)
+    for chunk in chunks:
+        yield from stream.feed(chunk)
+    yield from stream.close()
+
+async def aiter_elements(chunks:AsyncIterable[Union[str, bytes]],
+                         tag:str,
+                         attrs:dict={},
+                         encoding:str=None,
+                         parser:str=None
+                         ) -> AsyncIterator[Tag]:
+    stream = StreamParser(tag, attrs, encoding, parser)
+    async for chunk in chunks:
+        for element in stream.feed(chunk):
+            yield element
+    for element in stream.close():
+        yield element
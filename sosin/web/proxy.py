@@ -0,0 +1,130 @@
+import itertools
+import threading
+import time
+
+from typing import Iterable, Optional
+
+# statuses that point at the proxy (auth, ban, throttling) rather than the origin
+PROXY_FAILURE_STATUSES = (403, 407, 429)
+
+
+class _ProxyState:
+
+    __slots__ = ('url', 'latency', 'error_rate', 'failures', 'cooldown_until', 'requests')
+
+    def __init__(self, url:str) -> None:
+        self.url = url
+        self.latency = None
+        self.error_rate = 0.0
+        self.failures = 0
+        self.cooldown_until = 0.0
+        self.requests = 0
+
+    def score(self) -> float:
+        """
+        lower is better, unknown latency is tried first
+        """
+        return (self.latency or 0.0) * (1 + 4 * self.error_rate)
+
+
+class ProxyPool:
+    """
+    egress proxy pool with health scoring
+
+    proxies = ['http://user:pw@10.0.0.1:3128', 'socks5://10.0.0.2:1080', ...]
+    policy
+        round_robin: next healthy proxy
+        least_latency: healthy proxy with the best latency x error score
+        sticky: same proxy per target host while it stays healthy
+    a proxy failing `max_failures` times in a row cools down for `cooldown` seconds
+    latency and error rate are exponential moving averages (weight `alpha`)
+    """
+
+    POLICIES = ('round_robin', 'least_latency', 'sticky')
+
+    def __init__(self, 
+                 proxies:Iterable[str], 
+                 policy:str='round_robin', 
+                 cooldown:float=30.0, 
+                 max_failures:int=3, 
+                 alpha:float=0.2
+                 ) -> None:
+        assert policy in self.POLICIES, f'policy should be one of {self.POLICIES}'
+        self.policy = policy
+        self.cooldown = cooldown
+        self.max_failures = max_failures
+        self.alpha = alpha
+        self._proxies = {url: _ProxyState(url) for url in proxies}
+        assert self._proxies, 'proxies is empty'
+        self._cycle = itertools.cycle(list(self._proxies))
+        self._sticky = {}
+        self._lock = threading.Lock()
+
+    @property
+    def proxies(self) -> list[str]:
+        return list(self._proxies)
+
+    def select(self, host:str=None) -> str:
+        """
+        proxy for a request to host
+        when every proxy is cooling down, the one recovering first is used
+        """
+        with self._lock:
+            now = time.monotonic()
+            healthy = [p for p in self._proxies.values() if p.cooldown_until <= now]
+            if not healthy:
+                return min(self._proxies.values(), key=lambda p: p.cooldown_until).url
+
+            if self.policy == 'sticky' and host is not None:
+                url = self._sticky.get(host)
+                if url is not None and self._proxies[url].cooldown_until <= now:
+                    return url
+                # spread new hosts over the proxies with the best score
+                assigned = {}
+                for url in self._sticky.values():
+                    assigned[url] = assigned.get(url, 0) + 1
+                url = min(healthy, key=lambda p: (p.score(), assigned.get(p.url, 0))).url
+                self._sticky[host] = url
+                return url
+
+            if self.policy == 'least_latency':
+                return min(healthy, key=_ProxyState.score).url
+
+            for _ in range(len(self._proxies)):
+                url = next(self._cycle)
+                if self._proxies[url].cooldown_until <= now:
+                    return url
+            return healthy[0].url
+
+    def report(self, proxy:str, ok:bool, latency:Optional[float]=None) -> None:
+        with self._lock:
+            state = self._proxies.get(proxy)
+            if state is None:
+                return
+            state.requests += 1
+            state.error_rate += self.alpha * ((0.0 if ok else 1.0) - state.error_rate)
+            if latency is not None and ok:
+                state.latency = latency if state.latency is None \
+                    else state.latency + self.alpha * (latency - state.latency)
+
+            if ok:
+                state.failures = 0
+            else:
+                state.failures += 1
+                if state.failures >= self.max_failures:
+                    state.cooldown_until = time.monotonic() + self.cooldown
+                    state.failures = 0
+
+    def healthy(self) -> list[str]:
+        now = time.monotonic()
+        with self._lock:
+            return [p.url for p in self._proxies.values() if p.cooldown_until <= now]
+
+    def stats(self) -> dict:
+        now = time.monotonic()
+        with self._lock:
+            return {p.url: {'latency': p.latency, 
+                            'error_rate': p.error_rate, 
+                            'requests': p.requests, 
+                            'cooling_down': p.cooldown_until > now}
+                    for p in self._proxies.values()}
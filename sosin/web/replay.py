@@ -0,0 +1,324 @@
+import asyncio
+import base64
+import gzip
+import hashlib
+import io
+import json
+import threading
+import time
+
+from typing import Callable
+from urllib.parse import parse_qsl, urlencode, urlsplit, urlunsplit
+
+import httpx
+import requests
+from requests.adapters import BaseAdapter
+from requests.structures import CaseInsensitiveDict
+from requests.utils import get_encoding_from_headers
+
+from .cache import DROP_HEADERS
+from sosin.utils.history import HistoryManager
+
+def _body_bytes(body) -> bytes:
+    if body is None:
+        return b''
+    if isinstance(body, str):
+        return body.encode()
+    if isinstance(body, (bytes, bytearray)):
+        return bytes(body)
+    # generators, files, multipart encoders are matched on method and url only
+    return None
+
+def _decoded(r:httpx.Response, body:bytes) -> bytes:
+    """
+    raw httpx body -> content, archived bodies are stored without content-encoding
+    """
+    if body is None:
+        return None
+    try:
+        decoder = r._get_content_decoder()
+        return decoder.decode(body) + decoder.flush()
+    except Exception:
+        return None
+
+def _digest(body:bytes) -> str:
+    return hashlib.sha1(body).hexdigest() if body is not None else None
+
+def normalize(method:str, url:str) -> tuple[str, str]:
+    """
+    method and url with a sorted query, so recordings match however params were built
+    """
+    parts = urlsplit(url)
+    query = urlencode(sorted(parse_qsl(parts.query, keep_blank_values=True)))
+    return method.upper(), urlunsplit((parts.scheme, parts.netloc, parts.path or '/', query, ''))
+
+# ------------------------------------------------------------------------
+# Recording
+class Recorder(HistoryManager):
+    """
+    HistoryManager that also archives full request / response pairs
+
+    SessionManager(history_mode=Recorder('site.jsonl.gz'))
+    archive: gzip JSONL, one exchange per line (bodies base64)
+             every line is its own gzip member, so a killed run keeps what it recorded
+    streamed responses are recorded once their body was read to the end,
+    otherwise without body when they are closed
+    """
+
+    def __init__(self, path:str, max_size:int=1000, keep_body:bool=False, sink_path:str=None) -> None:
+        super().__init__(max_size, keep_body, sink_path)
+        self.path = path
+        self._archive = open(path, 'ab')
+        self._archive_lock = threading.Lock()
+
+    def add_history(self, r):
+        super().add_history(r)
+        if hasattr(r, 'num_bytes_downloaded'):
+            if not r.is_closed and not hasattr(r, '_content'):
+                r.stream = _AsyncTee(r.stream, lambda body: self._archive_entry(r, _decoded(r, body)))
+                return
+        elif not r._content_consumed and r.raw is not None:
+            r.raw = _Tee(r.raw, lambda body: self._archive_entry(r, body))
+            return
+        self._archive_entry(r)
+
+    def _archive_entry(self, r, body:bytes=None) -> None:
+        member = gzip.compress((json.dumps(self.make_entry(r, body), ensure_ascii=False) + '\n').encode('UTF-8'))
+        with self._archive_lock:
+            if self._archive is not None:
+                self._archive.write(member)
+                self._archive.flush()
+
+    def close(self):
+        super().close()
+        archive = getattr(self, '_archive', None)
+        if archive is not None:
+            with self._archive_lock:
+                archive.close()
+                self._archive = None
+
+    @staticmethod
+    def make_entry(r, body:bytes=None) -> dict:
+        """
+        requests.Response / httpx.Response -> archive entry
+        body: content of a streamed response (read through a tee)
+        """
+        request = r.request
+        # keyed on the url asked for, redirects are replayed as the final response
+        first = r.history[0].request if r.history else request
+        if hasattr(r, 'num_bytes_downloaded'):
+            # httpx
+            try:
+                request_body = first.content
+            except Exception:
+                request_body = None
+            content = r.content if hasattr(r, '_content') else b''
+        else:
+            request_body = _body_bytes(first.body)
+            content = r.content if r._content_consumed and r._content else b''
+        if body is not None:
+            content = body
+        try:
+            elapsed = r.elapsed.total_seconds()
+        except RuntimeError:
+            elapsed = 0.0
+
+        method, url = normalize(first.method, str(first.url))
+        return {'method': method,
+                'url': url,
+                'body_sha1': _digest(request_body),
+                'status': r.status_code,
+                'reason': getattr(r, 'reason', None) or getattr(r, 'reason_phrase', ''),
+                'final_url': str(r.url),
+                'headers': [(k, v) for k, v in r.headers.items() if k.lower() not in DROP_HEADERS],
+                'content': base64.b64encode(content).decode(),
+                'elapsed': elapsed,
+                'timestamp': time.time()}
+
+class _Tee:
+    """
+    urllib3 response wrapper collecting what iter_content streams
+    done(body) once the stream ended, done(None) when closed before that
+    """
+
+    def __init__(self, raw, done:Callable[[bytes], None]) -> None:
+        self._raw = raw
+        self._done = done
+        self._chunks = []
+
+    def __getattr__(self, name):
+        return getattr(self._raw, name)
+
+    def stream(self, *args, **kwargs):
+        for chunk in self._raw.stream(*args, **kwargs):
+            self._chunks.append(chunk)
+            yield chunk
+        self._finish(b''.join(self._chunks))
+
+    def close(self):
+        self._finish(None)
+        self._raw.close()
+
+    def release_conn(self):
+        self._finish(None)
+        self._raw.release_conn()
+
+    def _finish(self, body:bytes) -> None:
+        done, self._done = self._done, None
+        if done is not None:
+            done(body)
+
+class _AsyncTee(httpx.AsyncByteStream):
+    """
+    httpx body stream wrapper, same contract as _Tee
+    """
+
+    def __init__(self, stream:httpx.AsyncByteStream, done:Callable[[bytes], None]) -> None:
+        self._stream = stream
+        self._done = done
+        self._chunks = []
+
+    async def __aiter__(self):
+        async for chunk in self._stream:
+            self._chunks.append(chunk)
+            yield chunk
+        self._finish(b''.join(self._chunks))
+
+    async def aclose(self) -> None:
+        self._finish(None)
+        await self._stream.aclose()
+
+    def _finish(self, body:bytes) -> None:
+        done, self._done = self._done, None
+        if done is not None:
+            done(body)
+
+# ------------------------------------------------------------------------
+# Replay
+class ReplayArchive:
+    """
+    recordings served back in recorded order per request, cycling when exhausted
+
+    latency: fixed delay added to every reply (seconds)
+    scale: also wait scale * recorded elapsed (1.0 replays the recorded timing)
+    strict: unknown requests raise instead of getting a 404
+    matching: method + url (sorted query) + request body, then method + url
+    """
+
+    def __init__(self, path:str, latency:float=0.0, scale:float=0.0, strict:bool=True) -> None:
+        self.path = path
+        self.latency = latency
+        self.scale = scale
+        self.strict = strict
+        self._exact = {}
+        self._loose = {}
+        self._served = {}
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self._load()
+
+    def _load(self) -> None:
+        with gzip.open(self.path, 'rt', encoding='UTF-8') as f:
+            try:
+                for line in f:
+                    if not line.endswith('\n'):
+                        # cut off mid write
+                        break
+                    if not line.strip():
+                        continue
+                    self._add(json.loads(line))
+            except (EOFError, gzip.BadGzipFile):
+                # recorder killed while writing its last member
+                ...
+
+    def _add(self, entry:dict) -> None:
+        entry['content'] = base64.b64decode(entry['content'])
+        key = (entry['method'], entry['url'])
+        self._exact.setdefault(key + (entry['body_sha1'],), []).append(entry)
+        self._loose.setdefault(key, []).append(entry)
+
+    def __len__(self) -> int:
+        return sum(len(entries) for entries in self._loose.values())
+
+    def match(self, method:str, url:str, body:bytes=None) -> dict:
+        key = normalize(method, url)
+        exact = key + (_digest(body),)
+        with self._lock:
+            if exact in self._exact:
+                key = exact
+                entries = self._exact[exact]
+            else:
+                entries = self._loose.get(key)
+            if not entries:
+                self.misses += 1
+                return None
+            self.hits += 1
+            n = self._served.get(key, 0)
+            self._served[key] = n + 1
+        return entries[n % len(entries)]
+
+    def delay(self, entry:dict) -> float:
+        return self.latency + self.scale * (entry['elapsed'] if entry else 0.0)
+
+    def miss(self, method:str, url:str) -> dict:
+        if self.strict:
+            raise requests.ConnectionError(f'no recording for {method} {url}')
+        return {'status': 404, 'reason': 'Not Recorded', 'final_url': url,
+                'headers': [], 'content': b'', 'elapsed': 0.0}
+
+class ReplayAdapter(BaseAdapter):
+    """
+    requests transport adapter answering from a ReplayArchive
+    """
+
+    def __init__(self, archive:ReplayArchive) -> None:
+        super().__init__()
+        self.archive = archive
+
+    def send(self, request, stream=False, timeout=None, verify=True, cert=None, proxies=None):
+        entry = self.archive.match(request.method, request.url, _body_bytes(request.body))
+        if entry is None:
+            entry = self.archive.miss(request.method, request.url)
+        delay = self.archive.delay(entry)
+        if delay:
+            time.sleep(delay)
+
+        r = requests.Response()
+        r.status_code = entry['status']
+        r.reason = entry['reason']
+        r.url = entry['final_url']
+        r.headers = CaseInsensitiveDict(entry['headers'])
+        r.encoding = get_encoding_from_headers(r.headers)
+        r._content = entry['content']
+        # body already in memory, stream=True readers (iter_content, raw, close) still work
+        r._content_consumed = True
+        r.raw = io.BytesIO(entry['content'])
+        r.request = request
+        r.connection = self
+        return r
+
+    def close(self):
+        pass
+
+class ReplayTransport(httpx.AsyncBaseTransport):
+    """
+    httpx transport answering from a ReplayArchive
+    """
+
+    def __init__(self, archive:ReplayArchive) -> None:
+        self.archive = archive
+
+    async def handle_async_request(self, request:httpx.Request) -> httpx.Response:
+        body = await request.aread()
+        entry = self.archive.match(request.method, str(request.url), body)
+        if entry is None:
+            try:
+                entry = self.archive.miss(request.method, str(request.url))
+            except requests.ConnectionError as e:
+                raise httpx.ConnectError(str(e), request=request)
+        delay = self.archive.delay(entry)
+        if delay:
+            await asyncio.sleep(delay)
+        return httpx.Response(entry['status'], headers=entry['headers'], content=entry['content'],
+                              request=request)
@@ -0,0 +1,183 @@
+import random
+import threading
+import time
+
+from email.utils import parsedate_to_datetime
+from typing import Optional
+
+IDEMPOTENT_METHODS = frozenset(('get', 'head', 'options', 'trace', 'put', 'delete'))
+
+
+class CircuitOpenError(Exception):
+    """
+    raised instead of sending while a host's circuit is open
+    """
+
+    def __init__(self, host:str, retry_in:float) -> None:
+        super().__init__(f'circuit open for {host}, retry in {retry_in:.1f}s')
+        self.host = host
+        self.retry_in = retry_in
+
+
+class RetryPolicy:
+    """
+    Retry policy for _request
+
+    max_attempts: total tries including the first one
+    statuses: response statuses to retry
+    exceptions: exception classes to retry, None -> transport errors of the client
+    backoff, max_backoff: exponential backoff base and cap (sec)
+    jitter: full jitter, sleep a random time in [0, backoff]
+    respect_retry_after: use the Retry-After header when present (capped by max_backoff)
+
+    non idempotent methods (POST, PATCH) are retried only when the request has an
+    Idempotency-Key header, retry_non_idempotent=True, or the connection was never made
+    """
+
+    def __init__(self, 
+                 max_attempts:int=3, 
+                 statuses:tuple=(429, 500, 502, 503, 504), 
+                 exceptions:tuple=None, 
+                 backoff:float=0.5, 
+                 max_backoff:float=30.0, 
+                 jitter:bool=True, 
+                 respect_retry_after:bool=True, 
+                 retry_non_idempotent:bool=False
+                 ) -> None:
+        self.max_attempts = max_attempts
+        self.statuses = statuses
+        self.exceptions = exceptions
+        self.backoff = backoff
+        self.max_backoff = max_backoff
+        self.jitter = jitter
+        self.respect_retry_after = respect_retry_after
+        self.retry_non_idempotent = retry_non_idempotent
+
+    def is_idempotent(self, method:str, headers:dict=None) -> bool:
+        if self.retry_non_idempotent or method.lower() in IDEMPOTENT_METHODS:
+            return True
+        return any(k.lower() == 'idempotency-key' for k in headers or {})
+
+    def retry_status(self, attempt:int, method:str, headers:dict, status:int) -> bool:
+        return attempt < self.max_attempts and status in self.statuses \
+            and self.is_idempotent(method, headers)
+
+    def retry_error(self, 
+                    attempt:int, 
+                    method:str, 
+                    headers:dict, 
+                    error:Exception, 
+                    exceptions:tuple, 
+                    safe_exceptions:tuple=(), 
+                    unsent:bool=False
+                    ) -> bool:
+        """
+        exceptions: retryable classes when the policy has none
+        safe_exceptions: errors raised before the request was sent, always retryable
+        unsent: the client knows this error was raised before the request was sent
+        """
+        if attempt >= self.max_attempts:
+            return False
+        if not isinstance(error, self.exceptions or exceptions):
+            return False
+        return unsent or isinstance(error, safe_exceptions) or self.is_idempotent(method, headers)
+
+    def delay(self, attempt:int, retry_after:str=None) -> float:
+        if self.respect_retry_after and retry_after:
+            seconds = self.parse_retry_after(retry_after)
+            if seconds is not None:
+                return min(seconds, self.max_backoff)
+        delay = min(self.max_backoff, self.backoff * 2 ** (attempt - 1))
+        return random.uniform(0, delay) if self.jitter else delay
+
+    @staticmethod
+    def parse_retry_after(value:str) -> Optional[float]:
+        """
+        Retry-After: <seconds> or <http-date>
+        """
+        value = value.strip()
+        if value.isdigit():
+            return float(value)
+        try:
+            return max(0.0, parsedate_to_datetime(value).timestamp() - time.time())
+        except (TypeError, ValueError):
+            return None
+
+
+class _Circuit:
+
+    __slots__ = ('failures', 'opened_at', 'trial')
+
+    def __init__(self) -> None:
+        self.failures = 0
+        self.opened_at = None
+        self.trial = False
+
+
+class CircuitBreaker:
+    """
+    per host circuit breaker
+
+    after `failure_threshold` consecutive failures the host is open and requests
+    fail fast with CircuitOpenError for `recovery_time` seconds, then a single
+    trial request is let through (half open) and its result closes or reopens it
+    """
+
+    CLOSED = 'closed'
+    OPEN = 'open'
+    HALF_OPEN = 'half_open'
+
+    def __init__(self, failure_threshold:int=5, recovery_time:float=30.0) -> None:
+        self.failure_threshold = failure_threshold
+        self.recovery_time = recovery_time
+        self._circuits = {}
+        self._lock = threading.Lock()
+
+    def before(self, host:str) -> None:
+        """
+        raise CircuitOpenError if a request to host must not be sent now
+        """
+        with self._lock:
+            circuit = self._circuits.get(host)
+            if circuit is None or circuit.opened_at is None:
+                return
+            retry_in = circuit.opened_at + self.recovery_time - time.monotonic()
+            if retry_in > 0 or circuit.trial:
+                raise CircuitOpenError(host, max(retry_in, 0.0))
+            circuit.trial = True
+
+    def record(self, host:str, ok:bool) -> None:
+        with self._lock:
+            circuit = self._circuits.get(host)
+            if circuit is None:
+                if ok:
+                    return
+                circuit = self._circuits[host] = _Circuit()
+
+            if ok:
+                circuit.failures = 0
+                circuit.opened_at = None
+            else:
+                circuit.failures += 1
+                if circuit.trial or circuit.failures >= self.failure_threshold:
+                    circuit.opened_at = time.monotonic()
+            circuit.trial = False
+
+    def cancel_trial(self, host:str) -> None:
+        """
+        give the half open trial back without a verdict (cancelled / interrupted request)
+        the next request becomes the trial instead
+        """
+        with self._lock:
+            circuit = self._circuits.get(host)
+            if circuit is not None:
+                circuit.trial = False
+
+    def state(self, host:str) -> str:
+        with self._lock:
+            circuit = self._circuits.get(host)
+            if circuit is None or circuit.opened_at is None:
+                return self.CLOSED
+            if circuit.trial or time.monotonic() - circuit.opened_at >= self.recovery_time:
+                return self.HALF_OPEN
+            return self.OPEN
@@ -1,14 +1,51 @@
-import random
-import string
+import threading
+import time
 
-from typing import BinaryIO, Union
+from collections import deque
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from typing import TYPE_CHECKING, BinaryIO, Callable, Iterable, Iterator, Union
+from urllib.parse import urlsplit
 
 import requests
+from requests.adapters import HTTPAdapter
+from requests.structures import CaseInsensitiveDict
+from requests.utils import get_encoding_from_headers
 from requests_toolbelt import MultipartEncoder
+from urllib3.exceptions import NewConnectionError
 
+from .batch import BatchResult, make_request
+from .cache import CacheEntry, ResponseCache
+from .coalesce import COALESCE_METHODS, DEFAULT_KEY_HEADERS, SingleFlight, make_key
 from .cookie import CookieManager
+from .download import CHUNK_SIZE, download as download_file
+from .limiter import AdaptiveConcurrency, RateLimiter
+from .metrics import RequestMetrics
+from .multipart import guess_mime_type, make_boundary
+from .paginate import follow, page_items, page_request
+from .proxy import PROXY_FAILURE_STATUSES, ProxyPool
+from .replay import ReplayAdapter, ReplayArchive
+from .retry import CircuitBreaker, RetryPolicy
 from sosin.utils.history import HistoryManager
 
+if TYPE_CHECKING:
+    # bs4 / lxml load on the first parse, not with the session
+    from .parse import SoupStrainer, Tag
+
+RETRY_EXCEPTIONS = (requests.ConnectionError, requests.Timeout)
+# raised before anything was sent, safe to retry for any method
+SAFE_EXCEPTIONS = (requests.ConnectTimeout,)
+
+
+def _connect_failed(error:Exception) -> bool:
+    """
+    ConnectionError raised while opening the connection (refused, DNS), the request never left
+    read errors (reset, remote closed) may come after the server got the request
+    """
+    reason = error.args[0] if isinstance(error, requests.ConnectionError) and error.args else None
+    # MaxRetryError(reason=NewConnectionError)
+    reason = getattr(reason, 'reason', reason)
+    return isinstance(reason, NewConnectionError)
+
 class SessionManager(CookieManager):
     """
     Session Manager
@@ -16,11 +53,136 @@ class SessionManager(CookieManager):
 
     def __init__(self, 
                  cookie_path:str=None, 
-                 history_mode:bool=False
+                 history_mode:Union[bool, HistoryManager]=False,
+                 pool_connections:int=10,
+                 pool_maxsize:int=10,
+                 pool_block:bool=False,
+                 keep_alive:bool=True,
+                 cache:ResponseCache=None,
+                 rate_limiter:RateLimiter=None,
+                 concurrency:AdaptiveConcurrency=None,
+                 retry:RetryPolicy=None,
+                 breaker:CircuitBreaker=None,
+                 metrics:RequestMetrics=None,
+                 coalesce:bool=False,
+                 coalesce_headers:tuple=DEFAULT_KEY_HEADERS,
+                 proxy_pool:ProxyPool=None,
+                 replay:ReplayArchive=None
                  ) -> None:
-        super().__init__(cookie_path)
+        """
+        history_mode: True or a configured HistoryManager (size, bodies, JSONL sink)
+        pool_connections: number of host pools to keep
+        pool_maxsize: max connections kept alive per host
+        pool_block: wait for a free connection instead of opening a new one
+        keep_alive: False sends `Connection: close` with every request
+        cache: ResponseCache for GET responses
+        rate_limiter: RateLimiter pacing requests per host
+        concurrency: AdaptiveConcurrency limiting in-flight requests per host
+        retry: RetryPolicy for transient errors and statuses
+        breaker: CircuitBreaker failing fast while a host is down
+        metrics: RequestMetrics collecting per host phase timings and bytes
+        coalesce: concurrent identical GET/HEAD requests share one in-flight request
+        coalesce_headers: headers that tell identical requests apart (with method, url, params, cookies)
+        proxy_pool: ProxyPool rotating requests over egress proxies, one pooled session per proxy
+        replay: ReplayArchive answering every request offline (record with history_mode=Recorder(path))
+        """
         self._headers = { 'User-Agent': 'Mozilla/5.0' }
-        self.history_manager = HistoryManager() if history_mode else None
+        if not keep_alive:
+            self._headers['Connection'] = 'close'
+        self._pool_connections = pool_connections
+        self._pool_maxsize = pool_maxsize
+        self._pool_block = pool_block
+        self._pool_lock = threading.Lock()
+        self.replay = replay
+        self.session = self._new_session()
+        self.proxy_pool = proxy_pool
+        self._proxy_sessions = {}
+        self._proxy_lock = threading.Lock()
+        super().__init__(cookie_path)
+        if isinstance(history_mode, HistoryManager):
+            self.history_manager = history_mode
+        else:
+            self.history_manager = HistoryManager() if history_mode else None
+        self.cache = cache
+        self.rate_limiter = rate_limiter
+        self.concurrency = concurrency
+        self.retry = retry
+        self.breaker = breaker
+        self.metrics = metrics
+        self._flights = SingleFlight() if coalesce else None
+        self.coalesce_headers = coalesce_headers
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb) -> None:
+        self.close()
+
+    def __del__(self):
+        super().__del__()
+        self.close()
+
+    # ------------------------------------------------------------------------
+    # Connection Management
+    def _new_session(self) -> requests.Session:
+        session = requests.Session()
+        self._mount_adapter(session)
+        return session
+
+    def _mount_adapter(self, session:requests.Session) -> None:
+        if self.replay is not None:
+            adapter = ReplayAdapter(self.replay)
+            session.mount('http://', adapter)
+            session.mount('https://', adapter)
+            return
+        adapter = HTTPAdapter(pool_connections=self._pool_connections,
+                              pool_maxsize=self._pool_maxsize,
+                              pool_block=self._pool_block)
+        session.mount('http://', adapter)
+        session.mount('https://', adapter)
+
+    def close(self) -> None:
+        """
+        close pooled connections
+        """
+        session = getattr(self, 'session', None)
+        if session is not None:
+            session.close()
+        for proxy_session in getattr(self, '_proxy_sessions', {}).values():
+            proxy_session.close()
+
+    def _proxy_session(self, proxy:str) -> requests.Session:
+        """
+        session routed through proxy, connections stay pooled per proxy
+        """
+        session = self._proxy_sessions.get(proxy)
+        if session is None:
+            with self._proxy_lock:
+                session = self._proxy_sessions.get(proxy)
+                if session is None:
+                    session = self._new_session()
+                    session.proxies = {'http': proxy, 'https': proxy}
+                    self._proxy_sessions[proxy] = session
+        return session
+
+    # ------------------------------------------------------------------------
+    # Cookie Management
+    # keep session cookie jar in sync with CookieManager
+    def add_cookies(self, cookies:dict, domain:str='', path:str='/') -> None:
+        super().add_cookies(cookies, domain, path)
+        for k, v in cookies.items():
+            self.session.cookies.set(k, v, domain=domain, path=path)
+
+    def _reset_cookies(self, keys:list=[]) -> None:
+        with self._cookie_lock:
+            super()._reset_cookies(keys)
+            self.session.cookies.clear()
+            self._fill_jar(self.session.cookies)
+
+    def _load_cookies(self) -> dict:
+        super()._load_cookies()
+        self._fill_jar(self.session.cookies)
+        return self._cookies
     
     # ------------------------------------------------------------------------
     # Request Management
@@ -37,6 +199,20 @@ class SessionManager(CookieManager):
                           method='get', **kwargs)
         return r
 
+    def head(self, 
+             url:str, 
+             headers:dict={}, 
+             cookies:dict={},
+             params:dict={}, 
+             **kwargs
+             ) -> requests.Response:
+        
+        kwargs.setdefault('allow_redirects', False)
+        r = self._request(url, 
+                          headers=headers, cookies=cookies, params=params, 
+                          method='head', **kwargs)
+        return r
+
     def post(self, 
              url:str, 
              headers:dict={}, 
@@ -111,7 +287,7 @@ class SessionManager(CookieManager):
                  cookies:dict={}, 
                  params:dict={},
                  data:Union[str, dict]={}, 
-                 json:Union[dict, list]={}, 
+                 json:Union[dict, list]=None, 
                  files:dict[str]={}, 
                  method:str='post', 
                  **kwargs
@@ -119,52 +295,361 @@ class SessionManager(CookieManager):
         """
         files -> {key: file_path}
         """
+        if self._flights is not None and method.lower() in COALESCE_METHODS and not kwargs.get('stream'):
+            key = make_key(method, url, params, {**self._headers, **headers}, cookies, self.coalesce_headers)
+            return self._flights.do(key, lambda: self._do_request(url, headers, cookies, params, 
+                                                                  data, json, files, method, **kwargs))
+        return self._do_request(url, headers, cookies, params, data, json, files, method, **kwargs)
+
+    def _do_request(self, 
+                    url:str, 
+                    headers:dict={}, 
+                    cookies:dict={}, 
+                    params:dict={},
+                    data:Union[str, dict]={}, 
+                    json:Union[dict, list]=None, 
+                    files:dict[str]={}, 
+                    method:str='post', 
+                    **kwargs
+                    ) -> requests.Response:
         
         headers = {k.lower(): headers[k] for k in headers}
 
         type_header = {}
+        file_forms = {}
         if data:
             type_header['content-type'] = 'application/x-www-form-urlencoded'
         if json:
             type_header['content-type'] = 'application/json;charset=UTF-8'
         if files:
-            boundary = '----WebKitFormBoundary' +\
-                ''.join(random.sample(string.ascii_letters + string.digits, 16))
-            data = MultipartEncoder(fields={**data, **{k: self.get_file_form(v) for k, v in files.items()}}, boundary=boundary)
+            file_forms = {k: self.get_file_form(v) for k, v in files.items()}
+            data = MultipartEncoder(fields={**data, **file_forms}, boundary=make_boundary())
             type_header['content-type'] = data.content_type
             type_header['connection'] = 'keep-alive'
 
-        if method.lower() == 'get':
-            r = requests.get(url, 
-                             headers={**self._headers, **type_header, **headers},
-                             cookies={**self._cookies, **cookies}, 
-                             params=params, **kwargs)
-        elif method.lower() == 'post':
-            r = requests.post(url, 
-                              headers={**self._headers, **type_header, **headers}, 
-                              cookies={**self._cookies, **cookies},
-                              params=params, data=data, json=json, **kwargs)
-        elif method.lower() == 'put':
-            r = requests.put(url, 
-                             headers={**self._headers, **type_header, **headers}, 
-                             cookies={**self._cookies, **cookies},
-                             params=params, data=data, json=json, **kwargs)
-        elif method.lower() == 'patch':
-            r = requests.patch(url, 
-                             headers={**self._headers, **type_header, **headers}, 
-                             cookies={**self._cookies, **cookies},
-                             params=params, data=data, json=json, **kwargs)
-        elif method.lower() == 'delete':
-            r = requests.delete(url, 
-                             headers={**self._headers, **type_header, **headers}, 
-                             cookies={**self._cookies, **cookies},
-                             params=params, data=data, json=json, **kwargs)
+        cache_key, entry = None, None
+        if self.cache is not None and method.lower() == 'get' and not kwargs.get('stream'):
+            cache_key = self.cache.make_key(url, params)
+            # what the cached variant is matched against, without the validators added below
+            request_headers = {**self._headers, **type_header, **headers}
+            entry, fresh = self.cache.lookup(cache_key, request_headers)
+            if fresh:
+                return self._cached_response(entry)
+            if entry is not None:
+                headers = {**entry.validators, **headers}
+
+        try:
+            r = self._send(method, url, 
+                           headers={**self._headers, **type_header, **headers},
+                           cookies=cookies, 
+                           params=params, data=data, json=json, **kwargs)
+        finally:
+            for _, f, _ in file_forms.values():
+                f.close()
 
         self._set_cookies(r)
         self._add_history(r)
 
+        if cache_key is not None:
+            if r.status_code == 304 and entry is not None:
+                r = self._cached_response(self.cache.revalidated(cache_key, entry, r.headers))
+            else:
+                self.cache.store(cache_key, r.url, r.status_code, r.headers, r.content, request_headers)
+
+        return r
+
+    def _send(self, method:str, url:str, **kwargs) -> requests.Response:
+        """
+        send with the retry policy and host circuit breaker
+        """
+        retry = self.retry
+        if hasattr(kwargs.get('data'), 'read'):
+            # streamed bodies are consumed by the first try
+            retry = None
+        if retry is None and self.breaker is None:
+            return self._send_once(method, url, **kwargs)
+
+        host = urlsplit(url).hostname
+        headers = kwargs.get('headers')
+        attempt = 0
+        while True:
+            attempt += 1
+            if self.breaker is not None:
+                self.breaker.before(host)
+            try:
+                r = self._send_once(method, url, **kwargs)
+            except Exception as e:
+                if self.breaker is not None:
+                    self.breaker.record(host, False)
+                if retry is None or not retry.retry_error(attempt, method, headers, e, 
+                                                          RETRY_EXCEPTIONS, SAFE_EXCEPTIONS, 
+                                                          _connect_failed(e)):
+                    raise
+                time.sleep(retry.delay(attempt))
+                continue
+            except BaseException:
+                # cancelled / interrupted, no verdict on the host
+                if self.breaker is not None:
+                    self.breaker.cancel_trial(host)
+                raise
+
+            if self.breaker is not None:
+                self.breaker.record(host, r.status_code < 500)
+            if retry is not None and retry.retry_status(attempt, method, headers, r.status_code):
+                delay = retry.delay(attempt, r.headers.get('retry-after'))
+                r.close()
+                time.sleep(delay)
+                continue
+            return r
+
+    def _send_once(self, method:str, url:str, **kwargs) -> requests.Response:
+        """
+        send one request through the host rate limiter and concurrency window, 
+        timed when metrics are on
+        """
+        if self.proxy_pool is None and self.rate_limiter is None \
+            and self.concurrency is None and self.metrics is None:
+            return self.session.request(method.upper(), url, **kwargs)
+
+        host = urlsplit(url).hostname
+        session = self.session
+        proxy = None
+        if self.proxy_pool is not None:
+            proxy = self.proxy_pool.select(host)
+            session = self._proxy_session(proxy)
+            # per request, Session.proxies loses to HTTP(S)_PROXY from the environment
+            kwargs['proxies'] = {'http': proxy, 'https': proxy}
+            # proxy sessions don't share a jar, send the managed cookies explicitly
+            kwargs['cookies'] = {**self.cookies_for(url), **(kwargs.get('cookies') or {})}
+        if self.rate_limiter is not None:
+            self.rate_limiter.wait(host)
+        if self.concurrency is not None:
+            self.concurrency.acquire(host)
+
+        start = time.perf_counter()
+        r = None
+        try:
+            r = session.request(method.upper(), url, **kwargs)
+        finally:
+            elapsed = time.perf_counter() - start
+            if self.concurrency is not None:
+                self.concurrency.release(host, r.status_code if r is not None else None, 
+                                         elapsed, r is None)
+            if proxy is not None:
+                self.proxy_pool.report(proxy, 
+                                       r is not None and r.status_code not in PROXY_FAILURE_STATUSES, 
+                                       elapsed)
+        if self.metrics is not None:
+            self.metrics.record_requests(host, r, elapsed)
+        return r
+
+    @staticmethod
+    def _cached_response(entry:CacheEntry) -> requests.Response:
+        r = requests.Response()
+        r.status_code = entry.status
+        r.reason = 'OK'
+        r.url = entry.url
+        r.headers = CaseInsensitiveDict(entry.headers)
+        r.encoding = get_encoding_from_headers(r.headers)
+        r._content = entry.content
         return r
     
+    # ------------------------------------------------------------------------
+    # Batch Management
+    def map(self, 
+            method:str, 
+            urls:Iterable, 
+            workers:int=10
+            ) -> Iterator[BatchResult]:
+        """
+        run requests on a thread pool sharing the session pool, yield results as they finish
+
+        urls -> iterable of url or {'url': url, 'data': {...}, ...}
+        items are pulled only when a worker is about to free up
+        failures come back as BatchResult.error instead of stopping the batch
+        """
+        self._ensure_pool_size(workers)
+
+        items = iter(urls)
+        pending = set()
+        index = 0
+        exhausted = False
+        executor = ThreadPoolExecutor(max_workers=workers)
+        try:
+            while True:
+                # keep a few extra queued so workers never wait on the caller
+                while not exhausted and len(pending) < workers * 2:
+                    try:
+                        item = next(items)
+                    except StopIteration:
+                        exhausted = True
+                        break
+                    pending.add(executor.submit(self._fetch_one, index, make_request(item, method)))
+                    index += 1
+
+                if not pending:
+                    break
+
+                done, pending = wait(pending, return_when=FIRST_COMPLETED)
+                for future in done:
+                    yield future.result()
+        finally:
+            for future in pending:
+                future.cancel()
+            executor.shutdown(wait=False)
+
+    def _fetch_one(self, index:int, request:dict) -> BatchResult:
+        kwargs = dict(request)
+        url = kwargs.pop('url')
+        try:
+            r = self._request(url, **kwargs)
+        except Exception as e:
+            return BatchResult(index, request, error=e)
+        return BatchResult(index, request, response=r)
+
+    def paginate(self, 
+                 url:str, 
+                 extract:Callable, 
+                 next_page:Callable=None, 
+                 page_param:str='page', 
+                 start:int=1, 
+                 prefetch:int=4, 
+                 max_pages:int=None, 
+                 params:dict={}, 
+                 method:str='get', 
+                 **kwargs
+                 ) -> Iterator:
+        """
+        walk a paginated endpoint and yield the items extract(r) returns per page
+
+        page numbers (next_page=None): ?{page_param}=start, start+1, ... with the next
+        `prefetch` pages requested in the background, stops at the first empty page
+        cursors / next links: next_page(r) returns the next url, params to merge
+        ({'cursor': token}) or None on the last page, the next page is fetched
+        while the items of the current one are consumed
+        at most `prefetch` pages are held in memory
+        max_pages: stop after this many pages
+        """
+        kwargs['method'] = method
+        if next_page is None:
+            yield from self._paginate_pages(url, extract, page_param, start, prefetch, max_pages, params, kwargs)
+        else:
+            yield from self._paginate_links(url, extract, next_page, max_pages, params, kwargs)
+
+    def _paginate_pages(self, url, extract, page_param, start, prefetch, max_pages, params, kwargs) -> Iterator:
+        self._ensure_pool_size(prefetch)
+        stop = start + max_pages if max_pages is not None else None
+        executor = ThreadPoolExecutor(max_workers=prefetch)
+        pending = deque()
+        page = start
+        try:
+            while True:
+                while len(pending) < prefetch and (stop is None or page < stop):
+                    request = page_request(url, params, page_param, page)
+                    pending.append(executor.submit(self._request, request.pop('url'), **request, **kwargs))
+                    page += 1
+                if not pending:
+                    break
+                items = page_items(extract, pending.popleft().result())
+                if not items:
+                    break
+                yield from items
+        finally:
+            for future in pending:
+                future.cancel()
+            executor.shutdown(wait=False)
+
+    def _paginate_links(self, url, extract, next_page, max_pages, params, kwargs) -> Iterator:
+        executor = ThreadPoolExecutor(max_workers=1)
+        future = executor.submit(self._request, url, params=params, **kwargs)
+        count = 0
+        try:
+            while future is not None:
+                r = future.result()
+                future = None
+                count += 1
+                request = follow(url, params, next_page(r))
+                if request is not None and (max_pages is None or count < max_pages):
+                    url, params = request['url'], request['params']
+                    future = executor.submit(self._request, request['url'], params=params, **kwargs)
+                yield from page_items(extract, r)
+        finally:
+            if future is not None:
+                future.cancel()
+            executor.shutdown(wait=False)
+
+    def _ensure_pool_size(self, size:int) -> None:
+        """
+        grow host pools so `size` threads can keep their connections alive
+        replaced adapters are closed, requests in flight on them still finish
+        """
+        with self._pool_lock:
+            if size <= self._pool_maxsize:
+                return
+            self._pool_maxsize = size
+            for session in [self.session, *list(self._proxy_sessions.values())]:
+                replaced = session.adapters.get('https://')
+                self._mount_adapter(session)
+                if replaced is not None:
+                    replaced.close()
+
+    # ------------------------------------------------------------------------
+    # Download Management
+    def download(self, 
+                 url:str, 
+                 file_path:str, 
+                 parts:int=1, 
+                 chunk_size:int=CHUNK_SIZE, 
+                 resume:bool=True, 
+                 headers:dict={}, 
+                 **kwargs
+                 ) -> str:
+        """
+        stream url to file_path without holding the body in memory
+        resume: continue an interrupted download (file_path.part) with a Range request
+        parts: number of byte ranges fetched concurrently (needs Accept-Ranges)
+        every request goes through the manager (retry, limits, proxies, metrics, recording)
+        """
+        self._ensure_pool_size(parts)
+        return download_file(self, url, file_path, 
+                             parts=parts, chunk_size=chunk_size, resume=resume, 
+                             headers=headers, **kwargs)
+
+    # ------------------------------------------------------------------------
+    # Parsing
+    def parse(self, 
+              r:requests.Response, 
+              extract:Callable=None, 
+              parse_only:'SoupStrainer'=None, 
+              parser:str=None):
+        """
+        soup of a response with the fastest installed parser
+        parse_only: strainer('div', {'class': 'price'}), only those subtrees are built
+        extract: applied to the soup, e.g. Select('.price', one=True)
+        """
+        from .parse import parse as parse_html
+        soup = parse_html(r.text, parse_only, parser)
+        return soup if extract is None else extract(soup)
+
+    def iter_elements(self, 
+                      url:str, 
+                      tag:str, 
+                      attrs:dict={}, 
+                      chunk_size:int=CHUNK_SIZE, 
+                      parser:str=None, 
+                      **kwargs
+                      ) -> Iterator['Tag']:
+        """
+        stream a huge page and yield matching elements as they are parsed
+        """
+        from .parse import iter_elements
+        kwargs.setdefault('method', 'get')
+        r = self._request(url, stream=True, **kwargs)
+        try:
+            yield from iter_elements(r.iter_content(chunk_size), tag, attrs, r.encoding, parser)
+        finally:
+            r.close()
+
     # ------------------------------------------------------------------------
     # History Functions
     def _add_history(self, r):
@@ -182,20 +667,7 @@ class SessionManager(CookieManager):
         change file path to requestable formats
         """
         fn = f.split('/').pop()
-        ext = fn.split('.').pop()
-        mime_type = ''
-        if ext in ['jpg', 'jpeg']:
-            mime_type = 'image/jpeg'
-        elif ext == 'png':
-            mime_type = 'image/png'
-        elif ext == 'xlsx':
-            mime_type = 'application/vnd.openxmlformats-officedocument.spreadsheetml.sheet'
-        elif ext == 'xls':
-            mime_type = 'application/vnd.ms-excel'
-        elif ext == 'zip':
-            mime_type = 'application/x-zip-compressed'
-
-        return fn, open(f, 'rb'), mime_type
+        return fn, open(f, 'rb'), guess_mime_type(fn)
 
 if __name__ == '__main__':
     s = SessionManager()
@@ -1,14 +1,41 @@
-import random
-import string
+import asyncio
+import time
+import warnings
 
-from typing import BinaryIO, Union
+from collections import deque
+from concurrent.futures import Executor
+from contextlib import asynccontextmanager
+from typing import TYPE_CHECKING, AsyncIterable, AsyncIterator, BinaryIO, Callable, Iterable, Union
+from urllib.parse import urlsplit
 
 import httpx
-from requests_toolbelt import MultipartEncoder
+try:
+    import h2
+except:
+    h2 = None
 
+from .batch import BatchResult, make_request
+from .cache import CacheEntry, ResponseCache
+from .coalesce import COALESCE_METHODS, DEFAULT_KEY_HEADERS, AsyncSingleFlight, make_key
 from .cookie import CookieManager
+from .download import CHUNK_SIZE, adownload
+from .limiter import AdaptiveConcurrency, RateLimiter
+from .metrics import RequestMetrics
+from .multipart import AsyncMultipartStream, guess_mime_type
+from .paginate import follow, page_items, page_request
+from .proxy import PROXY_FAILURE_STATUSES, ProxyPool
+from .replay import ReplayArchive, ReplayTransport
+from .retry import CircuitBreaker, RetryPolicy
 from sosin.utils.history import HistoryManager
 
+if TYPE_CHECKING:
+    # bs4 / lxml load on the first parse, not with the session
+    from .parse import SoupStrainer, Tag
+
+RETRY_EXCEPTIONS = (httpx.TransportError,)
+# raised before anything was sent, safe to retry for any method
+SAFE_EXCEPTIONS = (httpx.ConnectError, httpx.ConnectTimeout)
+
 class AsyncSessionManager(CookieManager):
     """
     Session Manager
@@ -16,11 +43,157 @@ class AsyncSessionManager(CookieManager):
 
     history:list[httpx.Response] = []
 
-    def __init__(self, cookie_path:str=None, history_mode:bool=False, timeout:int=5) -> None:
+    def __init__(self, 
+                 cookie_path:str=None, 
+                 history_mode:Union[bool, HistoryManager]=False, 
+                 timeout:int=5,
+                 verify:bool=True,
+                 http2:bool=False,
+                 max_connections:int=100,
+                 max_keepalive_connections:int=20,
+                 keepalive_expiry:float=5.0,
+                 cache:ResponseCache=None,
+                 rate_limiter:RateLimiter=None,
+                 concurrency:AdaptiveConcurrency=None,
+                 retry:RetryPolicy=None,
+                 breaker:CircuitBreaker=None,
+                 metrics:RequestMetrics=None,
+                 coalesce:bool=False,
+                 coalesce_headers:tuple=DEFAULT_KEY_HEADERS,
+                 proxy_pool:ProxyPool=None,
+                 replay:ReplayArchive=None
+                 ) -> None:
+        """
+        history_mode: True or a configured HistoryManager (size, bodies, JSONL sink)
+        verify, timeout: client settings shared by every request
+        http2: use HTTP/2 multiplexing when the server supports it (needs h2)
+        max_connections: max open connections of the client
+        max_keepalive_connections: max idle connections kept alive
+        keepalive_expiry: seconds an idle connection is kept alive
+        cache: ResponseCache for GET responses
+        rate_limiter: RateLimiter pacing requests per host
+        concurrency: AdaptiveConcurrency limiting in-flight requests per host
+        retry: RetryPolicy for transient errors and statuses
+        breaker: CircuitBreaker failing fast while a host is down
+        metrics: RequestMetrics collecting per host phase timings and bytes
+        coalesce: concurrent identical GET/HEAD requests share one in-flight request
+        coalesce_headers: headers that tell identical requests apart (with method, url, params, cookies)
+        proxy_pool: ProxyPool rotating requests over egress proxies, one pooled client per proxy
+        replay: ReplayArchive answering every request offline (record with history_mode=Recorder(path))
+        """
         self._headers = { 'User-Agent': 'Mozilla/5.0' }
+        self._client = None
+        self._loop = None
+        self.proxy_pool = proxy_pool
+        self._proxy_clients = {}
+        self.replay = replay
         super().__init__(cookie_path)
-        self.history_manager = HistoryManager() if history_mode else None
+        if isinstance(history_mode, HistoryManager):
+            self.history_manager = history_mode
+        else:
+            self.history_manager = HistoryManager() if history_mode else None
         self.timeout = httpx.Timeout(timeout)
+        self.verify = verify
+        if http2 and h2 is None:
+            print('you need to install h2 for http2\n$ : python -m pip install httpx[http2]')
+            http2 = False
+        self.http2 = http2
+        self.limits = httpx.Limits(max_connections=max_connections, 
+                                   max_keepalive_connections=max_keepalive_connections, 
+                                   keepalive_expiry=keepalive_expiry)
+        self.cache = cache
+        self.rate_limiter = rate_limiter
+        self.concurrency = concurrency
+        self.retry = retry
+        self.breaker = breaker
+        self.metrics = metrics
+        self._flights = AsyncSingleFlight() if coalesce else None
+        self.coalesce_headers = coalesce_headers
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, exc_type, exc_val, exc_tb) -> None:
+        await self.aclose()
+
+    # ------------------------------------------------------------------------
+    # Connection Management
+    @property
+    def client(self) -> httpx.AsyncClient:
+        """
+        long-lived client, (re)created on first use
+        """
+        self._bind_loop()
+        if self._client is None or self._client.is_closed:
+            self._client = self._new_client()
+            self._fill_jar(self._client.cookies)
+        return self._client
+
+    def _new_client(self, proxy:str=None) -> httpx.AsyncClient:
+        if self.replay is not None:
+            kwargs = {'transport': ReplayTransport(self.replay)}
+        else:
+            kwargs = {'proxy': proxy} if proxy else {}
+        return httpx.AsyncClient(verify=self.verify, 
+                                 timeout=self.timeout, 
+                                 limits=self.limits, 
+                                 http2=self.http2, 
+                                 **kwargs)
+
+    def _proxy_client(self, proxy:str) -> httpx.AsyncClient:
+        """
+        client routed through proxy, connections stay pooled per proxy
+        """
+        self._bind_loop()
+        client = self._proxy_clients.get(proxy)
+        if client is None or client.is_closed:
+            client = self._proxy_clients[proxy] = self._new_client(proxy)
+        return client
+
+    def _bind_loop(self) -> None:
+        """
+        clients belong to the event loop their connections were opened on,
+        a manager reused under another loop (a second asyncio.run) starts new ones
+        """
+        try:
+            loop = asyncio.get_running_loop()
+        except RuntimeError:
+            return
+        if loop is self._loop:
+            return
+        if self._loop is not None:
+            # connections of the old loop can't be closed from this one, drop them
+            self._client = None
+            self._proxy_clients = {}
+        self._loop = loop
+
+    async def aclose(self) -> None:
+        """
+        close pooled connections
+        """
+        self._bind_loop()
+        if self._client is not None:
+            await self._client.aclose()
+            self._client = None
+        for client in self._proxy_clients.values():
+            await client.aclose()
+        self._proxy_clients = {}
+
+    # ------------------------------------------------------------------------
+    # Cookie Management
+    # keep client cookie jar in sync with CookieManager
+    def add_cookies(self, cookies:dict, domain:str='', path:str='/') -> None:
+        super().add_cookies(cookies, domain, path)
+        if self._client is not None:
+            for k, v in cookies.items():
+                self._client.cookies.set(k, v, domain=domain, path=path)
+
+    def _reset_cookies(self, keys:list=[]) -> None:
+        with self._cookie_lock:
+            super()._reset_cookies(keys)
+            if self._client is not None:
+                self._client.cookies.clear()
+                self._fill_jar(self._client.cookies)
 
     # ------------------------------------------------------------------------
     # Request Management
@@ -36,6 +209,31 @@ class AsyncSessionManager(CookieManager):
                                 method='get', **kwargs)
         return r
 
+    async def head(self, 
+                   url:str, 
+                   headers:dict={}, 
+                   cookies:dict={}, 
+                   params:dict={}, 
+                   **kwargs
+                   ) -> httpx.Response:
+        
+        r = await self._request(url, headers=headers, cookies=cookies, params=params,
+                                method='head', **kwargs)
+        return r
+
+    @asynccontextmanager
+    async def stream(self, method:str, url:str, **kwargs):
+        """
+        streamed response through the same path as every request (retry, limits, proxies, history)
+        async with manager.stream('GET', url) as r:
+            async for chunk in r.aiter_bytes(): ...
+        """
+        r = await self._request(url, method=method.lower(), stream=True, **kwargs)
+        try:
+            yield r
+        finally:
+            await r.aclose()
+
     async def post(self, 
                    url:str, 
                    headers:dict={}, 
@@ -114,9 +312,28 @@ class AsyncSessionManager(CookieManager):
                        ) -> httpx.Response:
         """
         files -> {key: file_path}
+        progress -> callback(sent_bytes, total_bytes) for file uploads
         """
+        if self._flights is not None and method.lower() in COALESCE_METHODS and not kwargs.get('stream'):
+            key = make_key(method, url, params, {**self._headers, **headers}, cookies, self.coalesce_headers)
+            return await self._flights.do(key, lambda: self._do_request(url, headers, cookies, params, 
+                                                                        data, json, files, method, **kwargs))
+        return await self._do_request(url, headers, cookies, params, data, json, files, method, **kwargs)
+
+    async def _do_request(self, 
+                          url:str, 
+                          headers:dict={}, 
+                          cookies:dict={}, 
+                          params:dict={}, 
+                          data:Union[str, dict]={}, 
+                          json:Union[dict, list]=None, 
+                          files:dict[str]={}, 
+                          method:str='post', 
+                          **kwargs
+                          ) -> httpx.Response:
         
         headers = {k.lower(): headers[k] for k in headers}
+        progress = kwargs.pop('progress', None)
 
         type_header = {}
         if data:
@@ -124,44 +341,371 @@ class AsyncSessionManager(CookieManager):
         if json:
             type_header['content-type'] = 'application/json;charset=UTF-8'
         if files:
-            boundary = '----WebKitFormBoundary' +\
-                ''.join(random.sample(string.ascii_letters + string.digits, 16))
-            data = MultipartEncoder(fields={**data, **{k: self.get_file_form(v) for k, v in files.items()}}, boundary=boundary)
-            type_header['content-type'] = data.content_type
+            # file parts are streamed from disk while sending
+            kwargs['content'] = AsyncMultipartStream(data, files, progress=progress)
+            data = {}
+            type_header['content-type'] = kwargs['content'].content_type
+            type_header['content-length'] = str(kwargs['content'].content_length)
             type_header['connection'] = 'keep-alive'
 
-        async with httpx.AsyncClient(verify=kwargs.pop('verify', True), timeout=self.timeout) as client:
-            if method.lower() == 'get':
-                r = await client.get(url, 
-                                     headers={**self._headers, **type_header, **headers}, 
-                                     cookies={**self._cookies, **cookies}, 
-                                     params=params, **kwargs)
-            elif method.lower() == 'post':
-                r = await client.post(url, 
-                                      headers={**self._headers, **type_header, **headers},
-                                      cookies={**self._cookies, **cookies},
-                                      params=params, data=data, json=json, **kwargs)
-            elif method.lower() == 'put':
-                r = await client.put(url, 
-                                     headers={**self._headers, **type_header, **headers},
-                                     cookies={**self._cookies, **cookies}, 
-                                     params=params, data=data, json=json, **kwargs)
-            elif method.lower() == 'patch':
-                r = await client.patch(url, 
-                                       headers={**self._headers, **type_header, **headers}, 
-                                       cookies={**self._cookies, **cookies}, 
-                                       params=params, data=data, json=json, **kwargs)
-            elif method.lower() == 'delete':
-                r = await client.delete(url, 
-                                        headers={**self._headers, **type_header, **headers}, 
-                                        cookies={**self._cookies, **cookies}, 
-                                        params=params, data=data, json=json, **kwargs)
-            
+        if 'verify' in kwargs:
+            kwargs.pop('verify')
+            warnings.warn('verify is a client setting, pass it to AsyncSessionManager()', 
+                          DeprecationWarning, stacklevel=3)
+
+        cache_key, entry = None, None
+        if self.cache is not None and method.lower() == 'get' and not kwargs.get('stream'):
+            cache_key = self.cache.make_key(url, params)
+            # what the cached variant is matched against, without the validators added below
+            request_headers = {**self._headers, **type_header, **headers}
+            entry, fresh = self.cache.lookup(cache_key, request_headers)
+            if fresh:
+                return self._cached_response(entry)
+            if entry is not None:
+                headers = {**entry.validators, **headers}
+
+        r = await self._send(method, url, 
+                             headers={**self._headers, **type_header, **headers}, 
+                             cookies=cookies or None, 
+                             # httpx replaces the url query with an empty params dict
+                             params=params or None, data=data, json=json, **kwargs)
+
         self._set_cookies(r)
         self._add_history(r)
 
+        if cache_key is not None:
+            if r.status_code == 304 and entry is not None:
+                r = self._cached_response(self.cache.revalidated(cache_key, entry, r.headers))
+            else:
+                self.cache.store(cache_key, str(r.url), r.status_code, r.headers, r.content, request_headers)
+
+        return r
+
+    async def _send(self, method:str, url:str, **kwargs) -> httpx.Response:
+        """
+        send with the retry policy and host circuit breaker
+        """
+        retry = self.retry
+        if hasattr(kwargs.get('data'), 'read'):
+            # streamed bodies are consumed by the first try
+            retry = None
+        if retry is None and self.breaker is None:
+            return await self._send_once(method, url, **kwargs)
+
+        host = urlsplit(url).hostname
+        headers = kwargs.get('headers')
+        attempt = 0
+        while True:
+            attempt += 1
+            if self.breaker is not None:
+                self.breaker.before(host)
+            try:
+                r = await self._send_once(method, url, **kwargs)
+            except Exception as e:
+                if self.breaker is not None:
+                    self.breaker.record(host, False)
+                if retry is None or not retry.retry_error(attempt, method, headers, e, 
+                                                          RETRY_EXCEPTIONS, SAFE_EXCEPTIONS):
+                    raise
+                await asyncio.sleep(retry.delay(attempt))
+                continue
+            except BaseException:
+                # cancelled / interrupted, no verdict on the host
+                if self.breaker is not None:
+                    self.breaker.cancel_trial(host)
+                raise
+
+            if self.breaker is not None:
+                self.breaker.record(host, r.status_code < 500)
+            if retry is not None and retry.retry_status(attempt, method, headers, r.status_code):
+                delay = retry.delay(attempt, r.headers.get('retry-after'))
+                await r.aclose()
+                await asyncio.sleep(delay)
+                continue
+            return r
+
+    async def _send_once(self, method:str, url:str, **kwargs) -> httpx.Response:
+        """
+        send one request through the host rate limiter and concurrency window, 
+        traced when metrics are on
+        """
+        if self.proxy_pool is None and self.rate_limiter is None \
+            and self.concurrency is None and self.metrics is None:
+            return await self._client_send(self.client, method, url, kwargs)
+
+        host = urlsplit(url).hostname
+        client = self.client
+        proxy = None
+        if self.proxy_pool is not None:
+            proxy = self.proxy_pool.select(host)
+            client = self._proxy_client(proxy)
+            # proxy clients don't share a jar, send the managed cookies explicitly
+            kwargs['cookies'] = {**self.cookies_for(url), **(kwargs.get('cookies') or {})}
+        if self.rate_limiter is not None:
+            await self.rate_limiter.wait_async(host)
+        if self.concurrency is not None:
+            await self.concurrency.acquire_async(host)
+
+        trace = None
+        if self.metrics is not None:
+            trace = self.metrics.trace()
+            kwargs['extensions'] = {**kwargs.get('extensions', {}), 'trace': trace}
+
+        start = time.perf_counter()
+        r = None
+        try:
+            r = await self._client_send(client, method, url, kwargs)
+        finally:
+            elapsed = time.perf_counter() - start
+            if self.concurrency is not None:
+                self.concurrency.release(host, r.status_code if r is not None else None, 
+                                         elapsed, r is None)
+            if proxy is not None:
+                self.proxy_pool.report(proxy, 
+                                       r is not None and r.status_code not in PROXY_FAILURE_STATUSES, 
+                                       elapsed)
+        if trace is not None:
+            self.metrics.record_httpx(host, r, trace, elapsed)
         return r
+
+    @staticmethod
+    async def _client_send(client:httpx.AsyncClient, method:str, url:str, kwargs:dict) -> httpx.Response:
+        """
+        client.request, or build + send for stream=True (body left unread, caller closes it)
+        """
+        kwargs = dict(kwargs)
+        if not kwargs.pop('stream', False):
+            return await client.request(method.upper(), url, **kwargs)
+        auth = kwargs.pop('auth', httpx.USE_CLIENT_DEFAULT)
+        follow_redirects = kwargs.pop('follow_redirects', httpx.USE_CLIENT_DEFAULT)
+        request = client.build_request(method.upper(), url, **kwargs)
+        return await client.send(request, stream=True, auth=auth, follow_redirects=follow_redirects)
+
+    @staticmethod
+    def _cached_response(entry:CacheEntry) -> httpx.Response:
+        return httpx.Response(entry.status, headers=entry.headers, content=entry.content, 
+                              request=httpx.Request('GET', entry.url))
     
+    # ------------------------------------------------------------------------
+    # Batch Management
+    async def fetch_many(self, 
+                         requests:Union[Iterable, AsyncIterable], 
+                         concurrency:int=10, 
+                         method:str='get'
+                         ) -> AsyncIterator[BatchResult]:
+        """
+        run requests with at most `concurrency` in flight, yield results in completion order
+
+        requests -> (async) iterable of url or {'url': url, 'method': 'post', ...}
+        items are pulled only when a slot is free, so generators of any size are fine
+        failures come back as BatchResult.error instead of cancelling the batch
+        """
+        items = self._aiter(requests)
+        pending = set()
+        index = 0
+        exhausted = False
+        try:
+            while True:
+                while not exhausted and len(pending) < concurrency:
+                    try:
+                        item = await items.__anext__()
+                    except StopAsyncIteration:
+                        exhausted = True
+                        break
+                    pending.add(asyncio.ensure_future(self._fetch_one(index, make_request(item, method))))
+                    index += 1
+
+                if not pending:
+                    break
+
+                done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+                for task in done:
+                    yield task.result()
+        finally:
+            for task in pending:
+                task.cancel()
+
+    async def fetch_many_ordered(self, 
+                                 requests:Union[Iterable, AsyncIterable], 
+                                 concurrency:int=10, 
+                                 method:str='get'
+                                 ) -> AsyncIterator[BatchResult]:
+        """
+        same as fetch_many, but yield results in input order
+        at most 2 * concurrency results are held while waiting for a slow one
+        """
+        items = self._aiter(requests)
+        pending = set()
+        finished = {}
+        index = 0
+        next_index = 0
+        exhausted = False
+        try:
+            while True:
+                while not exhausted and len(pending) < concurrency \
+                        and index - next_index < concurrency * 2:
+                    try:
+                        item = await items.__anext__()
+                    except StopAsyncIteration:
+                        exhausted = True
+                        break
+                    pending.add(asyncio.ensure_future(self._fetch_one(index, make_request(item, method))))
+                    index += 1
+
+                if not pending:
+                    break
+
+                done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+                for task in done:
+                    result = task.result()
+                    finished[result.index] = result
+                while next_index in finished:
+                    yield finished.pop(next_index)
+                    next_index += 1
+        finally:
+            for task in pending:
+                task.cancel()
+
+    async def _fetch_one(self, index:int, request:dict) -> BatchResult:
+        kwargs = dict(request)
+        url = kwargs.pop('url')
+        try:
+            r = await self._request(url, **kwargs)
+        except Exception as e:
+            return BatchResult(index, request, error=e)
+        return BatchResult(index, request, response=r)
+
+    async def paginate(self, 
+                       url:str, 
+                       extract:Callable, 
+                       next_page:Callable=None, 
+                       page_param:str='page', 
+                       start:int=1, 
+                       prefetch:int=4, 
+                       max_pages:int=None, 
+                       params:dict={}, 
+                       method:str='get', 
+                       **kwargs
+                       ) -> AsyncIterator:
+        """
+        walk a paginated endpoint and yield the items extract(r) returns per page
+
+        page numbers (next_page=None): ?{page_param}=start, start+1, ... with the next
+        `prefetch` pages requested in the background, stops at the first empty page
+        cursors / next links: next_page(r) returns the next url, params to merge
+        ({'cursor': token}) or None on the last page, the next page is fetched
+        while the items of the current one are consumed
+        at most `prefetch` pages are held in memory
+        max_pages: stop after this many pages
+        """
+        kwargs['method'] = method
+        if next_page is None:
+            pages = self._paginate_pages(url, extract, page_param, start, prefetch, max_pages, params, kwargs)
+        else:
+            pages = self._paginate_links(url, extract, next_page, max_pages, params, kwargs)
+        async for items in pages:
+            for item in items:
+                yield item
+
+    async def _paginate_pages(self, url, extract, page_param, start, prefetch, max_pages, params, kwargs) -> AsyncIterator[list]:
+        stop = start + max_pages if max_pages is not None else None
+        pending = deque()
+        page = start
+        try:
+            while True:
+                while len(pending) < prefetch and (stop is None or page < stop):
+                    request = page_request(url, params, page_param, page)
+                    pending.append(asyncio.ensure_future(self._request(request.pop('url'), **request, **kwargs)))
+                    page += 1
+                if not pending:
+                    break
+                items = page_items(extract, await pending.popleft())
+                if not items:
+                    break
+                yield items
+        finally:
+            for task in pending:
+                task.cancel()
+
+    async def _paginate_links(self, url, extract, next_page, max_pages, params, kwargs) -> AsyncIterator[list]:
+        task = asyncio.ensure_future(self._request(url, params=params, **kwargs))
+        count = 0
+        try:
+            while task is not None:
+                r = await task
+                task = None
+                count += 1
+                request = follow(url, params, next_page(r))
+                if request is not None and (max_pages is None or count < max_pages):
+                    url, params = request['url'], request['params']
+                    task = asyncio.ensure_future(self._request(request['url'], params=params, **kwargs))
+                yield page_items(extract, r)
+        finally:
+            if task is not None:
+                task.cancel()
+
+    @staticmethod
+    async def _aiter(items:Union[Iterable, AsyncIterable]) -> AsyncIterator:
+        if hasattr(items, '__aiter__'):
+            async for item in items:
+                yield item
+        else:
+            for item in items:
+                yield item
+
+    # ------------------------------------------------------------------------
+    # Download Management
+    async def download(self, 
+                       url:str, 
+                       file_path:str, 
+                       parts:int=1, 
+                       chunk_size:int=CHUNK_SIZE, 
+                       resume:bool=True, 
+                       headers:dict={}, 
+                       **kwargs
+                       ) -> str:
+        """
+        stream url to file_path without holding the body in memory
+        resume: continue an interrupted download (file_path.part) with a Range request
+        parts: number of byte ranges fetched concurrently (needs Accept-Ranges)
+        every request goes through the manager (retry, limits, proxies, metrics, recording)
+        """
+        return await adownload(self, url, file_path, 
+                               parts=parts, chunk_size=chunk_size, resume=resume, 
+                               headers=headers, **kwargs)
+
+    # ------------------------------------------------------------------------
+    # Parsing
+    async def parse(self, 
+                    r:httpx.Response, 
+                    extract:Callable, 
+                    parse_only:'SoupStrainer'=None, 
+                    parser:str=None, 
+                    executor:Executor=None):
+        """
+        parse and extract in a process pool so the event loop never stalls
+        extract: picklable and returning plain data, e.g. Select('.price', one=True)
+        parse_only: strainer('div', {'class': 'price'}), only those subtrees are built
+        """
+        from .parse import parse_async
+        return await parse_async(r.text, extract, parse_only, parser, executor)
+
+    async def iter_elements(self, 
+                            url:str, 
+                            tag:str, 
+                            attrs:dict={}, 
+                            parser:str=None, 
+                            headers:dict={}, 
+                            **kwargs
+                            ) -> AsyncIterator['Tag']:
+        """
+        stream a huge page and yield matching elements as they are parsed
+        """
+        from .parse import aiter_elements
+        async with self.stream('GET', url, headers=headers, **kwargs) as r:
+            async for element in aiter_elements(r.aiter_bytes(), tag, attrs, r.charset_encoding, parser):
+                yield element
+
     # ------------------------------------------------------------------------
     # History Functions
     def _add_history(self, r):
@@ -179,20 +723,7 @@ class AsyncSessionManager(CookieManager):
         change file path to requestable formats
         """
         fn = f.split('/').pop()
-        ext = fn.split('.').pop()
-        mime_type = ''
-        if ext in ['jpg', 'jpeg']:
-            mime_type = 'image/jpeg'
-        elif ext == 'png':
-            mime_type = 'image/png'
-        elif ext == 'xlsx':
-            mime_type = 'application/vnd.openxmlformats-officedocument.spreadsheetml.sheet'
-        elif ext == 'xls':
-            mime_type = 'application/vnd.ms-excel'
-        elif ext == 'zip':
-            mime_type = 'application/x-zip-compressed'
-
-        return fn, open(f, 'rb'), mime_type
+        return fn, open(f, 'rb'), guess_mime_type(fn)
 
 if __name__ == '__main__':
     s = AsyncSessionManager()
@@ -0,0 +1,172 @@
+import asyncio
+import threading
+
+from concurrent.futures import Future
+from typing import Awaitable, Iterable, Iterator
+
+import httpx
+
+from .batch import BatchResult, make_request
+from .session_async import AsyncSessionManager
+
+class BackgroundSessionManager:
+    """
+    blocking facade over AsyncSessionManager for sync code (Django views, batch scripts)
+
+    one background thread runs a persistent event loop that owns a long-lived
+    AsyncSessionManager, so the connection pool, cookies and cache survive
+    between calls instead of being torn down by asyncio.run every time
+    args and kwargs go to AsyncSessionManager
+    """
+
+    def __init__(self, *args, **kwargs) -> None:
+        self._loop = asyncio.new_event_loop()
+        self._thread = threading.Thread(target=self._run, name='sosin-session-loop', daemon=True)
+        self._thread.start()
+        # built on the loop so every asyncio primitive belongs to it
+        self.manager = self._call(self._create(args, kwargs))
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb) -> None:
+        self.close()
+
+    def __del__(self):
+        self.close()
+
+    # ------------------------------------------------------------------------
+    # Loop Management
+    def _run(self) -> None:
+        asyncio.set_event_loop(self._loop)
+        self._loop.run_forever()
+
+    @staticmethod
+    async def _create(args:tuple, kwargs:dict) -> AsyncSessionManager:
+        return AsyncSessionManager(*args, **kwargs)
+
+    def submit(self, coro:Awaitable) -> Future:
+        """
+        schedule a coroutine on the background loop, returns a concurrent Future
+        """
+        if self._loop.is_closed():
+            raise RuntimeError('session manager is closed')
+        return asyncio.run_coroutine_threadsafe(coro, self._loop)
+
+    def _call(self, coro:Awaitable):
+        if threading.current_thread() is self._thread:
+            coro.close()
+            raise RuntimeError('blocking call from the session loop would deadlock, await the manager instead')
+        return self.submit(coro).result()
+
+    def close(self) -> None:
+        """
+        close pooled connections and stop the loop thread
+        """
+        loop = getattr(self, '_loop', None)
+        if loop is None or loop.is_closed():
+            return
+        manager = getattr(self, 'manager', None)
+        if manager is not None and threading.current_thread() is not self._thread:
+            self._call(manager.aclose())
+        loop.call_soon_threadsafe(loop.stop)
+        if threading.current_thread() is not self._thread:
+            self._thread.join()
+            loop.close()
+
+    # ------------------------------------------------------------------------
+    # Cookie Management
+    def add_cookies(self, cookies:dict, domain:str='', path:str='/') -> None:
+        self._loop.call_soon_threadsafe(self.manager.add_cookies, cookies, domain, path)
+
+    def get_cookie(self, key:str) -> str:
+        return self.manager.get_cookie(key)
+
+    # ------------------------------------------------------------------------
+    # Request Management
+    def get(self, url:str, **kwargs) -> httpx.Response:
+        return self._call(self.manager.get(url, **kwargs))
+
+    def post(self, url:str, **kwargs) -> httpx.Response:
+        return self._call(self.manager.post(url, **kwargs))
+
+    def put(self, url:str, **kwargs) -> httpx.Response:
+        return self._call(self.manager.put(url, **kwargs))
+
+    def patch(self, url:str, **kwargs) -> httpx.Response:
+        return self._call(self.manager.patch(url, **kwargs))
+
+    def delete(self, url:str, **kwargs) -> httpx.Response:
+        return self._call(self.manager.delete(url, **kwargs))
+
+    def request(self, method:str, url:str, **kwargs) -> Future:
+        """
+        non-blocking request, Future.result(timeout) gives the response
+        """
+        return self.submit(getattr(self.manager, method.lower())(url, **kwargs))
+
+    # ------------------------------------------------------------------------
+    # Batch Management
+    def iter_many(self,
+                  requests:Iterable,
+                  concurrency:int=10,
+                  method:str='get',
+                  ordered:bool=False
+                  ) -> Iterator[BatchResult]:
+        """
+        blocking iterator over AsyncSessionManager.fetch_many(_ordered)
+        up to `concurrency` requests stay in flight on the loop while the caller works
+        """
+        fetch = self.manager.fetch_many_ordered if ordered else self.manager.fetch_many
+        results = fetch(requests, concurrency=concurrency, method=method)
+        try:
+            while True:
+                try:
+                    yield self._call(results.__anext__())
+                except StopAsyncIteration:
+                    break
+        finally:
+            self._call(results.aclose())
+
+    def fetch_many(self,
+                   requests:Iterable,
+                   concurrency:int=10,
+                   method:str='get',
+                   ordered:bool=True
+                   ) -> list[BatchResult]:
+        """
+        send every request with at most `concurrency` in flight and wait for all
+        failures come back as BatchResult.error
+        """
+        return list(self.iter_many(requests, concurrency, method, ordered))
+
+    def submit_many(self,
+                    requests:Iterable,
+                    concurrency:int=10,
+                    method:str='get'
+                    ) -> list[Future]:
+        """
+        schedule every request at once and return one Future per request (input order)
+        the loop still keeps at most `concurrency` in flight
+        """
+        semaphore = self._call(self._semaphore(concurrency))
+        return [self.submit(self._limited(semaphore, index, make_request(item, method)))
+                for index, item in enumerate(requests)]
+
+    @staticmethod
+    async def _semaphore(value:int) -> asyncio.Semaphore:
+        return asyncio.Semaphore(value)
+
+    async def _limited(self, semaphore:asyncio.Semaphore, index:int, request:dict) -> BatchResult:
+        async with semaphore:
+            return await self.manager._fetch_one(index, request)
+
+    # ------------------------------------------------------------------------
+    # Download Management
+    def download(self, url:str, file_path:str, **kwargs) -> str:
+        return self._call(self.manager.download(url, file_path, **kwargs))
+
+    # ------------------------------------------------------------------------
+    # History Functions
+    def get_histories(self) -> list:
+        return self.manager.get_histories()
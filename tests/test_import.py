@@ -0,0 +1,27 @@
+import json
+import subprocess
+import sys
+
+# generous for cold caches on CI, `import sosin` alone takes well under a millisecond
+IMPORT_BUDGET = 0.2
+HEAVY_MODULES = ('selenium', 'webdriver_manager', 'pymysql', 'psycopg2')
+
+CODE = '''
+import json, sys, time
+start = time.perf_counter()
+import sosin
+elapsed = time.perf_counter() - start
+sosin.read_config
+print(json.dumps({'elapsed': elapsed, 'modules': sorted(sys.modules)}))
+'''
+
+def _import_sosin() -> dict:
+    out = subprocess.run([sys.executable, '-c', CODE], capture_output=True, text=True, check=True)
+    return json.loads(out.stdout.strip().splitlines()[-1])
+
+def test_import_is_fast():
+    assert _import_sosin()['elapsed'] < IMPORT_BUDGET
+
+def test_import_skips_heavy_modules():
+    loaded = {name.split('.')[0] for name in _import_sosin()['modules']}
+    assert not loaded & set(HEAVY_MODULES)
@@ -0,0 +1,27 @@
+import socket
+
+import pytest
+import requests
+
+from sosin.web.retry import RetryPolicy
+from sosin.web.session import SessionManager
+
+
+def _closed_port() -> int:
+    with socket.socket() as s:
+        s.bind(('127.0.0.1', 0))
+        return s.getsockname()[1]
+
+def test_post_retried_when_connection_refused():
+    manager = SessionManager(retry=RetryPolicy(max_attempts=3, backoff=0, jitter=False))
+    attempts = []
+    send_once = manager._send_once
+    def counted(*args, **kwargs):
+        attempts.append(1)
+        return send_once(*args, **kwargs)
+    manager._send_once = counted
+
+    with pytest.raises(requests.ConnectionError):
+        manager.post(f'http://127.0.0.1:{_closed_port()}/', data={'a': 1}, timeout=2)
+    # nothing reached the server, POST is as safe to resend as GET
+    assert len(attempts) == 3